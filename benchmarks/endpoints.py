@@ -0,0 +1,453 @@
+"""Load benchmark of the API endpoints against a locally started server.
+
+Seeds a database with realistic volumes (by default 10^6 feedback rows and
+10^4 verified tokens), starts gunicorn or uvicorn on it together with the
+smtp_sink command as mail server, and drives each endpoint at a fixed
+concurrency for a fixed time. Reports throughput and p50/p95/p99 latency per
+endpoint as JSON and compares them with a stored baseline:
+
+    python benchmarks/endpoints.py --save-baseline          # on the base commit
+    python benchmarks/endpoints.py                          # after the change
+
+Exits with status 1 if an endpoint got slower than the baseline by more than
+--tolerance. The baseline (benchmarks/baseline.json by default) only makes
+sense for the machine it was measured on, so it is not kept in git: create it
+with --save-baseline on the commit to compare against. The seeded database is kept in the temp directory and copied for
+every run, so all runs start from the same data. TRATROUBLE_* variables in
+the environment are passed on to the server, e.g. to compare settings.
+"""
+import argparse
+import hashlib
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = ROOT / 'benchmarks' / 'baseline.json'
+
+DEVICE_ID = 'benchmark-device'
+METRICS_TOKEN = 'benchmark'
+
+LINES = [f'M{n}' for n in range(1, 20)] + [f'U{n}' for n in range(1, 10)] + [f'S{n}' for n in range(1, 48)]
+DESTINATIONS = [f'Stop {n}' for n in range(400)]
+
+
+def token(kind, index):
+    return hashlib.sha256(f'benchmark-{kind}-{index}'.encode()).hexdigest()
+
+
+def geo_location(rng):
+    # Around Berlin
+    return f'{rng.uniform(52.35, 52.65):.5f},{rng.uniform(13.1, 13.7):.5f}'
+
+
+def feedback_item(rng):
+    return {'line': rng.choice(LINES), 'destination': rng.choice(DESTINATIONS), 'geo_location': geo_location(rng)}
+
+
+def environment(db_path, metrics_dir=None, smtp_port=None):
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='tratroubleBackend.settings',
+        TRATROUBLE_DEBUG='False',
+        TRATROUBLE_SQLITE_PATH=str(db_path),
+        TRATROUBLE_ALLOWED_HOSTS='127.0.0.1,localhost',
+        TRATROUBLE_METRICS_TOKEN=METRICS_TOKEN,
+    )
+    if metrics_dir:
+        env['TRATROUBLE_METRICS_DIR'] = str(metrics_dir)
+    if smtp_port:
+        env.update(
+            TRATROUBLE_EMAIL_HOST='127.0.0.1',
+            TRATROUBLE_EMAIL_PORT=str(smtp_port),
+            TRATROUBLE_EMAIL_USE_TLS='False',
+        )
+    return env
+
+
+# -- Seeding ------------------------------------------------------------------
+
+def seed(db_path, feedback_rows, verified, pending, hours, batch_size=10000):
+    """Fill a migrated database; runs in a child process.
+
+    Writes what the load generator needs to know about the data to
+    ``<db_path>.json``.
+    """
+    os.environ.update(environment(db_path))
+    sys.path.insert(0, str(ROOT))
+    import django
+    django.setup()
+    from datetime import timedelta
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.db import transaction
+    from django.utils import timezone
+    from feedback import ingestion, rollups
+    from feedback.models import EmailVerification, Feedback
+
+    rng = random.Random(42)
+    now = timezone.now()
+    # A logged-in staff session for export-feedback; Basic auth would mostly
+    # measure the password hasher
+    staff = User.objects.create_superuser('benchmark', 'benchmark@example.com', None)
+    session = SessionStore()
+    session[SESSION_KEY] = str(staff.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = staff.get_session_auth_hash()
+    session.set_expiry(timedelta(days=3650))
+    session.save()
+    verifications = [
+        EmailVerification(
+            email=f'user{i}@example.com', token=token('verified', i), device_id=DEVICE_ID,
+            expires_at=now + timedelta(days=365), verified=True,
+        )
+        for i in range(verified)
+    ] + [
+        EmailVerification(
+            email=f'pending{i}@example.com', token=token('pending', i), device_id=DEVICE_ID,
+            expires_at=now + timedelta(days=365), verified=False,
+        )
+        for i in range(pending)
+    ]
+    EmailVerification.objects.bulk_create(verifications, batch_size=batch_size)
+    verified_ids = list(EmailVerification.objects.filter(verified=True).order_by('id').values_list('id', flat=True))
+
+    # Spread the rows over the past ``hours`` instead of stamping them all now
+    Feedback._meta.get_field('timestamp').auto_now_add = False
+    for start in range(0, feedback_rows, batch_size):
+        rows = []
+        for _ in range(min(batch_size, feedback_rows - start)):
+            row = ingestion.build_feedback(rng.choice(verified_ids), feedback_item(rng))
+            row.timestamp = now - timedelta(seconds=rng.uniform(0, hours * 3600))
+            rows.append(row)
+        with transaction.atomic():
+            Feedback.objects.bulk_create(rows)
+    rollups.rebuild()
+
+    info = {
+        'session': session.session_key,
+        'max_feedback_id': Feedback.objects.order_by('-id').values_list('id', flat=True).first() or 0,
+    }
+    Path(f'{db_path}.json').write_text(json.dumps(info))
+
+
+def seeded_database(args):
+    """Path of a seeded database for ``args``, created on first use."""
+    migrations = sorted(path.name for path in (ROOT / 'feedback' / 'migrations').glob('0*.py'))
+    key = hashlib.sha256(json.dumps(
+        [migrations, args.feedback, args.verified, args.pending, args.hours]).encode()).hexdigest()[:12]
+    path = Path(tempfile.gettempdir()) / f'tratrouble-benchmark-{key}.sqlite3'
+    if path.exists():
+        return path
+    partial = path.with_suffix('.partial')
+    partial.unlink(missing_ok=True)
+    print(f'Seeding {args.feedback} feedback rows into {path} ...', file=sys.stderr)
+    started = time.monotonic()
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+                   cwd=ROOT, env=environment(partial), check=True)
+    process = multiprocessing.get_context('spawn').Process(
+        target=seed, args=(partial, args.feedback, args.verified, args.pending, args.hours))
+    process.start()
+    process.join()
+    if process.exitcode:
+        sys.exit('Seeding failed')
+    Path(f'{partial}.json').rename(f'{path}.json')
+    partial.rename(path)
+    print(f'Seeded in {time.monotonic() - started:.0f}s', file=sys.stderr)
+    return path
+
+
+# -- Server -------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+                '--log-level', 'warning', 'tratroubleBackend.wsgi:application']
+    return [sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+            '--log-level', 'warning', 'tratroubleBackend.asgi:application']
+
+
+def wait_until_up(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit('Server exited during startup')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/api/check-token/')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit('Server did not start')
+
+
+# -- Scenarios ----------------------------------------------------------------
+
+class Scenarios:
+    """Builds ``(method, path, body, headers)`` for the requests of each endpoint."""
+
+    def __init__(self, args, seed_info):
+        self.args = args
+        self.seed_info = seed_info
+        self._pending = itertools.count()
+        self._emails = itertools.count()
+        # Runs share the seeded database; addresses of an earlier run would hit the resend throttle
+        self._run = int(time.time())
+
+    def verified_token(self, rng):
+        return token('verified', rng.randrange(self.args.verified))
+
+    def check_token(self, rng):
+        return 'GET', f'/api/check-token/?token={self.verified_token(rng)}', None, {}
+
+    def submit_feedback(self, rng):
+        return 'POST', '/api/submit-feedback/', dict(feedback_item(rng), token=self.verified_token(rng)), {}
+
+    def submit_feedback_batch(self, rng):
+        items = [feedback_item(rng) for _ in range(20)]
+        return 'POST', '/api/submit-feedback-batch/', {'token': self.verified_token(rng), 'items': items}, {}
+
+    def top_lines(self, rng):
+        return 'GET', f'/api/top-lines/?token={self.verified_token(rng)}', None, {}
+
+    def verify_email(self, rng):
+        index = next(self._pending)
+        if index >= self.args.pending:
+            return None  # All pending tokens used up
+        return 'POST', '/api/verify-email/', {'token': token('pending', index)}, {'X-Device-ID': DEVICE_ID}
+
+    def submit_email(self, rng):
+        email = f'new{self._run}-{next(self._emails)}@example.com'
+        return 'POST', '/api/submit-email/', {'email': email}, {'X-Device-ID': DEVICE_ID}
+
+    def bad_json(self, rng):
+        body = {'token': self.verified_token(rng), 'json': '{"broken": ', 'target': 'departures'}
+        return 'POST', '/api/bad-json/', body, {}
+
+    def export_feedback(self, rng):
+        since_id = max(0, self.seed_info['max_feedback_id'] - 1000)
+        cookie = f"sessionid={self.seed_info['session']}"
+        return 'GET', f'/api/export-feedback/?since_id={since_id}', None, {'Cookie': cookie}
+
+    def metrics(self, rng):
+        return 'GET', '/api/metrics/', None, {'Authorization': f'Bearer {METRICS_TOKEN}'}
+
+
+ENDPOINTS = {
+    'check-token': Scenarios.check_token,
+    'submit-feedback': Scenarios.submit_feedback,
+    'submit-feedback-batch': Scenarios.submit_feedback_batch,
+    'top-lines': Scenarios.top_lines,
+    'verify-email': Scenarios.verify_email,
+    'submit-email': Scenarios.submit_email,
+    'bad-json': Scenarios.bad_json,
+    'export-feedback': Scenarios.export_feedback,
+    'metrics': Scenarios.metrics,
+}
+
+
+# -- Load ---------------------------------------------------------------------
+
+def drive(port, build, concurrency, warmup, duration):
+    """Send requests from ``concurrency`` keep-alive connections; return the measurements."""
+    start = time.monotonic() + warmup
+    end = start + duration
+    lock = threading.Lock()
+    latencies = []
+    errors = {}
+
+    def worker(seed):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        own = []
+        own_errors = {}
+        while True:
+            request = build(rng)
+            now = time.monotonic()
+            if request is None or now >= end:
+                break
+            method, path, body, headers = request
+            if body is not None:
+                headers = dict(headers, **{'Content-Type': 'application/json'})
+                body = json.dumps(body)
+            sent = time.perf_counter()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                outcome = response.status
+            except (OSError, http.client.HTTPException) as exc:
+                outcome = type(exc).__name__
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            elapsed = time.perf_counter() - sent
+            if now < start:
+                continue
+            if outcome == 200:
+                own.append(elapsed)
+            else:
+                own_errors[str(outcome)] = own_errors.get(str(outcome), 0) + 1
+        connection.close()
+        with lock:
+            latencies.extend(own)
+            for outcome, count in own_errors.items():
+                errors[outcome] = errors.get(outcome, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    measured = min(duration, max(time.monotonic() - start, 1e-9))
+    return summarize(latencies, errors, measured)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def summarize(latencies, errors, seconds):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / seconds, 1),
+        'mean_ms': _ms(statistics.mean(latencies)) if latencies else None,
+        'p50_ms': _ms(percentile(latencies, 0.50)),
+        'p95_ms': _ms(percentile(latencies, 0.95)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+    }
+
+
+# -- Baseline -----------------------------------------------------------------
+
+def compare(results, baseline, tolerance):
+    """Regressions of ``results`` against ``baseline`` as human-readable strings."""
+    regressions = []
+    for name, result in results['endpoints'].items():
+        base = baseline.get('endpoints', {}).get(name)
+        if not base or not base['requests'] or not result['requests']:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput']} -> {result['throughput']} req/s")
+        if result['errors'] and not base['errors']:
+            regressions.append(f"{name}: errors {result['errors']}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    seed_path = seeded_database(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'db.sqlite3'
+        shutil.copyfile(seed_path, db_path)
+        smtp_port, port = free_port(), free_port()
+        env = environment(db_path, Path(tmp) / 'metrics', smtp_port)
+        sink = subprocess.Popen([sys.executable, 'manage.py', 'smtp_sink', '--port', str(smtp_port), '--quiet'],
+                                cwd=ROOT, env=env)
+        server = subprocess.Popen(server_command(args.server, port, args.workers), cwd=ROOT, env=env)
+        try:
+            wait_until_up(port, server)
+            scenarios = Scenarios(args, json.loads(Path(f'{seed_path}.json').read_text()))
+            results = {}
+            for name in args.endpoint or ENDPOINTS:
+                build = ENDPOINTS[name].__get__(scenarios)
+                results[name] = drive(port, build, args.concurrency, args.warmup, args.duration)
+                result = results[name]
+                print(f"{name:<22} {result['throughput']:>8} req/s  p50 {result['p50_ms']} ms  "
+                      f"p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors'] or 0}",
+                      file=sys.stderr)
+        finally:
+            server.terminate()
+            sink.terminate()
+            server.wait()
+            sink.wait()
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'server': args.server,
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'seed': {'feedback': args.feedback, 'verified': args.verified, 'pending': args.pending},
+        'endpoints': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--endpoint', choices=ENDPOINTS, action='append', help="Endpoint(s) to run (default: all).")
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent client connections.")
+    parser.add_argument('--duration', type=float, default=10, help="Measured seconds per endpoint.")
+    parser.add_argument('--warmup', type=float, default=2, help="Unmeasured seconds before each endpoint.")
+    parser.add_argument('--feedback', type=int, default=1_000_000, help="Seeded feedback rows.")
+    parser.add_argument('--verified', type=int, default=10_000, help="Seeded verified tokens.")
+    parser.add_argument('--pending', type=int, default=100_000, help="Seeded tokens for verify-email.")
+    parser.add_argument('--hours', type=int, default=24 * 30, help="Time span of the seeded feedback.")
+    parser.add_argument('--output', type=Path, help="Write the JSON results to this file.")
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Allowed relative change of p95 and throughput (default: 0.1).")
+    args = parser.parse_args()
+
+    results = run(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(output + '\n')
+    else:
+        print(output)
+
+    if args.save_baseline:
+        args.baseline.write_text(output + '\n')
+        print(f'Saved baseline to {args.baseline}', file=sys.stderr)
+    elif args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.baseline}', file=sys.stderr)
+    else:
+        print(f'No baseline at {args.baseline} to compare with; run with --save-baseline '
+              f'on the commit to compare against first', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
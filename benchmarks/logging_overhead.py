@@ -0,0 +1,101 @@
+"""Time spent in logging calls on the calling thread: direct vs. queued handlers.
+
+Several threads log records as fast as they can, once with the console and
+file handlers attached directly to the logger (the old configuration) and once
+behind QueueingHandler, and the latency of the logging calls is reported.
+Console output goes to a temporary file so that the terminal does not skew
+the numbers.
+
+    python benchmarks/logging_overhead.py --threads 8 --records 5000
+"""
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from tratroubleBackend.log_handlers import GzipRotatingFileHandler, JsonFormatter, QueueingHandler  # noqa: E402
+
+
+def io_handlers(directory):
+    console = logging.StreamHandler(open(Path(directory) / 'console.log', 'w'))
+    console.set_name('bench-console')
+    console.setFormatter(logging.Formatter('{levelname} {asctime} {module} {process:d} {thread:d} {message}', style='{'))
+    file = GzipRotatingFileHandler(Path(directory) / 'debug.log', maxBytes=10 * 1024 * 1024, backupCount=3)
+    file.set_name('bench-file')
+    file.setFormatter(JsonFormatter())
+    return console, file
+
+
+def run(logger, threads, records):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def work():
+        own = []
+        barrier.wait()
+        for i in range(records):
+            started = time.perf_counter()
+            logger.info('feedback stored for line %s (%s)', 'M10', i)
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'records_per_s': len(latencies) / elapsed,
+        'mean_us': statistics.mean(latencies) * 1e6,
+        'p99_us': latencies[int(len(latencies) * 0.99)] * 1e6,
+        'max_us': latencies[-1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--records', type=int, default=5000, help='records per thread')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        console, file = io_handlers(directory)
+        results = {}
+
+        logger = logging.getLogger('bench.direct')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(console)
+        logger.addHandler(file)
+        results['direct'] = run(logger, args.threads, args.records)
+
+        queued = QueueingHandler(targets=['bench-console', 'bench-file'], queue_size=args.threads * args.records)
+        logger = logging.getLogger('bench.queued')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(queued)
+        results['queued'] = run(logger, args.threads, args.records)
+
+        for handler in (queued, console, file):
+            handler.close()
+
+    print(f"{'handlers':<10} {'records/s':>10} {'mean us':>9} {'p99 us':>9} {'max us':>9}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['records_per_s']:>10.0f} {result['mean_us']:>9.1f} "
+              f"{result['p99_us']:>9.1f} {result['max_us']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
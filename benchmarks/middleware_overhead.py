@@ -0,0 +1,110 @@
+"""Per-request cost of the middleware stack on check-token: full vs. lean.
+
+Builds two Django WSGI handlers in one process, one with the full middleware
+list and one with LeanAPIMiddleware, and calls them directly, without a
+network server or the test client, with alternating check-token requests so
+that both see the same conditions. Reports the time per request and the
+saving.
+
+    python benchmarks/middleware_overhead.py --requests 20000
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+TOKEN = 'b' * 64
+
+
+def setup(path):
+    os.environ.update(
+        DJANGO_SETTINGS_MODULE='tratroubleBackend.settings',
+        TRATROUBLE_DEBUG='False',
+        TRATROUBLE_ALLOWED_HOSTS='testserver',
+        TRATROUBLE_SQLITE_PATH=path,
+        TRATROUBLE_LEAN_API_MIDDLEWARE='True',
+        TRATROUBLE_ADMISSION_CONTROL='False',
+        TRATROUBLE_METRICS='False',
+    )
+    sys.path.insert(0, str(ROOT))
+    import django
+    django.setup()
+    from datetime import timedelta
+    from django.core.management import call_command
+    from django.utils import timezone
+    from feedback.models import EmailVerification
+
+    call_command('migrate', verbosity=0)
+    EmailVerification.objects.create(
+        email='benchmark@example.com', token=TOKEN, verified=True,
+        expires_at=timezone.now() + timedelta(days=1),
+    )
+
+
+def handlers():
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import override_settings
+
+    lean = settings.MIDDLEWARE
+    position = lean.index('feedback.middleware.LeanAPIMiddleware')
+    full = lean[:position] + settings.SESSION_MIDDLEWARE + lean[position + 1:]
+    with override_settings(MIDDLEWARE=full):
+        full_handler = WSGIHandler()
+    return {'full': full_handler, 'lean': WSGIHandler()}
+
+
+def check_token(handler):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': '/api/check-token/',
+        'QUERY_STRING': f'token={TOKEN}',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'testserver',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+    }
+    statuses = []
+    response = handler(environ, lambda status, headers: statuses.append(status))
+    b''.join(response)
+    response.close()
+    return statuses[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=20000, help="Requests per stack.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(os.path.join(tmp, 'db.sqlite3'))
+        stacks = handlers()
+        for name, handler in stacks.items():
+            for _ in range(500):
+                status = check_token(handler)
+            assert status.startswith('200'), f'{name}: {status}'
+
+        timings = {name: [] for name in stacks}
+        for _ in range(args.requests):
+            for name, handler in stacks.items():
+                started = time.perf_counter()
+                check_token(handler)
+                timings[name].append(time.perf_counter() - started)
+
+    medians = {name: statistics.median(values) for name, values in timings.items()}
+    for name, values in timings.items():
+        print(f"{name:>5}: mean {statistics.mean(values) * 1e6:7.1f} us, "
+              f"median {medians[name] * 1e6:7.1f} us per request")
+    saved = medians['full'] - medians['lean']
+    print(f"saved: {saved * 1e6:.1f} us per request ({saved / medians['full']:.0%} of the median)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Concurrent SQLite writers: default vs. production database profile.
+
+Starts several processes that submit feedback as fast as they can against a
+fresh database, once per database profile, and reports the throughput and how
+many submissions failed with "database is locked".
+
+    python benchmarks/sqlite_writers.py --writers 8 --rows 200
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PROFILES = ('default', 'production')
+
+
+def environment(profile, path):
+    return dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='tratroubleBackend.settings',
+        TRATROUBLE_DEBUG='False',
+        TRATROUBLE_DATABASE_PROFILE=profile,
+        TRATROUBLE_SQLITE_PATH=path,
+    )
+
+
+def writer(profile, path, rows, barrier, results):
+    os.environ.update(environment(profile, path))
+    sys.path.insert(0, str(ROOT))
+    import django
+    django.setup()
+    from django.db import OperationalError
+    from feedback import ingestion
+
+    item = {'line': 'M10', 'destination': 'S+U Warschauer Str.', 'geo_location': '52.5219,13.4132'}
+    stored = failed = 0
+    barrier.wait()
+    for _ in range(rows):
+        try:
+            ingestion.store_feedback([ingestion.build_feedback(None, item)])
+            stored += 1
+        except OperationalError:
+            failed += 1
+    results.put((stored, failed))
+
+
+def run(profile, writers, rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'db.sqlite3')
+        subprocess.run(
+            [sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+            cwd=ROOT, env=environment(profile, path), check=True,
+        )
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(writers + 1)
+        results = context.Queue()
+        processes = [
+            context.Process(target=writer, args=(profile, path, rows, barrier, results))
+            for _ in range(writers)
+        ]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        started = time.monotonic()
+        totals = [results.get() for _ in processes]
+        elapsed = time.monotonic() - started
+        for process in processes:
+            process.join()
+    stored = sum(stored for stored, _ in totals)
+    failed = sum(failed for _, failed in totals)
+    return stored, failed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=200, help="Submissions per writer.")
+    parser.add_argument('--profile', choices=PROFILES, action='append',
+                        help="Profile(s) to run (default: all).")
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers x {args.rows} submissions")
+    for profile in args.profile or PROFILES:
+        stored, failed, elapsed = run(profile, args.writers, args.rows)
+        print(f"{profile:>10}: {stored / elapsed:8.1f} rows/s, {stored} stored, "
+              f"{failed} failed, {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
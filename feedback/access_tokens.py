@@ -0,0 +1,142 @@
+"""Signed access tokens that prove a verified email without a database read.
+
+The 64-hex verification token is only a lookup key. After verify-email (and
+on check-token with a verified token) the app also gets an access token:
+the verification id and the device id, signed with SECRET_KEY by
+django.core.signing and valid for ACCESS_TOKEN_LIFETIME seconds.
+IsValidTokenPermission and CheckTokenView check its signature and age only.
+
+Access is revoked per verification with the ``revoke_access`` command. The
+revoked verification ids are kept in memory and reloaded every
+ACCESS_TOKEN_REVOCATION_REFRESH seconds, so a revocation reaches all
+processes within that time.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core import signing
+
+from .models import RevokedAccess
+
+SALT = 'feedback.access-token'
+
+
+class Claims(NamedTuple):
+    verification_id: int  # Stored with submitted feedback
+    device_id: str
+    issued_at: datetime
+
+    @property
+    def expires_at(self):
+        return self.issued_at + timedelta(seconds=settings.ACCESS_TOKEN_LIFETIME)
+
+
+class InvalidAccessToken(Exception):
+    status_code = 404  # What check-token answers
+
+
+class ExpiredAccessToken(InvalidAccessToken):
+    status_code = 401
+
+
+class RevokedAccessToken(InvalidAccessToken):
+    status_code = 403
+
+
+class ForeignDeviceAccessToken(InvalidAccessToken):
+    status_code = 403
+
+
+def is_access_token(token):
+    """Tell signed access tokens from verification tokens, which are plain hex."""
+    return isinstance(token, str) and ':' in token
+
+
+def issue(ev):
+    """A signed access token for the verified EmailVerification ``ev`` and its expiry."""
+    signed = signing.dumps({'v': ev.id, 'd': ev.device_id}, salt=SALT)
+    return signed, datetime.now(dt_timezone.utc) + timedelta(seconds=settings.ACCESS_TOKEN_LIFETIME)
+
+
+def grant(ev):
+    """Response fields handing out an access token for ``ev``, if they are enabled."""
+    if not settings.ACCESS_TOKENS_ENABLED:
+        return {}
+    token, expires_at = issue(ev)
+    return {'access_token': token, 'access_token_expires_at': expires_at}
+
+
+def _claims(token):
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=settings.ACCESS_TOKEN_LIFETIME)
+    except signing.SignatureExpired as exc:
+        raise ExpiredAccessToken('Access token expired') from exc
+    except signing.BadSignature as exc:
+        raise InvalidAccessToken('Invalid access token') from exc
+    timestamp = signing.b62_decode(token.rsplit(':', 2)[1])
+    return Claims(payload['v'], payload['d'], datetime.fromtimestamp(timestamp, dt_timezone.utc))
+
+
+def _check_device(claims, device_id):
+    if settings.ACCESS_TOKEN_BIND_DEVICE and device_id and claims.device_id and device_id != claims.device_id:
+        raise ForeignDeviceAccessToken('Access token was issued to another device')
+
+
+def verify(token, device_id=None):
+    """Claims of a valid access token; raises InvalidAccessToken or a subclass otherwise.
+
+    ``device_id`` is the X-Device-ID the request was sent with, if any.
+    """
+    claims = _claims(token)
+    _check_device(claims, device_id)
+    if is_revoked(claims.verification_id):
+        raise RevokedAccessToken('Access revoked')
+    return claims
+
+
+async def averify(token, device_id=None):
+    """Async version of verify() for the ASGI views."""
+    claims = _claims(token)
+    _check_device(claims, device_id)
+    if await ais_revoked(claims.verification_id):
+        raise RevokedAccessToken('Access revoked')
+    return claims
+
+
+_revoked = frozenset()
+_loaded_at = None
+_lock = threading.Lock()
+
+
+def _stale():
+    return _loaded_at is None or time.monotonic() - _loaded_at >= settings.ACCESS_TOKEN_REVOCATION_REFRESH
+
+
+def _store(ids):
+    global _revoked, _loaded_at
+    _revoked = frozenset(ids)
+    _loaded_at = time.monotonic()
+
+
+def is_revoked(verification_id):
+    """Whether access of the verification was revoked, as of the last reload."""
+    if _stale():
+        with _lock:
+            if _stale():
+                _store(RevokedAccess.objects.values_list('verification_id', flat=True))
+    return verification_id in _revoked
+
+
+async def ais_revoked(verification_id):
+    if _stale():
+        _store([pk async for pk in RevokedAccess.objects.values_list('verification_id', flat=True)])
+    return verification_id in _revoked
+
+
+def reload_revocations():
+    """Make the next check reload the revocation list, e.g. right after a change."""
+    global _loaded_at
+    _loaded_at = None
@@ -0,0 +1,97 @@
+"""Admin for the Feedback and EmailVerification tables, which grow to millions of rows.
+
+The changelists never count the whole table: EstimatedCountPaginator takes
+the row count from the database statistics, filtered lists are counted up to
+COUNT_LIMIT rows, and the "N total" link of show_full_result_count is off.
+Lists are ordered along an index, read one page of it at a time, are
+narrowed with date_hierarchy on an indexed timestamp, and only load the
+columns they display.
+"""
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from .models import EmailVerification, Feedback
+
+# Filtered changelists show at most this many rows' worth of pages
+COUNT_LIMIT = 10000
+
+
+def estimated_rows(qs):
+    """Approximate number of rows of the table of ``qs``, without counting them; None if unknown."""
+    connection = connections[qs.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [qs.model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table was first analyzed
+        return row[0] if row and row[0] >= 0 else None
+    # The largest id is found via the primary key index. Deleted rows make it an overestimate.
+    return qs.model._default_manager.using(qs.db).aggregate(last=Max('pk'))['last'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that estimates the count of an unfiltered list and caps the count of a filtered one."""
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = estimated_rows(qs)
+            if estimate is not None:
+                return estimate
+        # COUNT(*) over a LIMITed subquery stops after COUNT_LIMIT rows
+        return qs.order_by()[:COUNT_LIMIT].count()
+
+
+class ColumnsChangeList(ChangeList):
+    """ChangeList that only loads the ``list_columns`` of its ModelAdmin, one page at most."""
+
+    def get_queryset(self, request, exclude_parameters=None):
+        qs = super().get_queryset(request, exclude_parameters)
+        return qs.only(*self.model_admin.list_columns)
+
+    def get_results(self, request):
+        super().get_results(request)
+        # Django loads a list it takes for a single page without a LIMIT, but
+        # the estimated count may be far too low, e.g. before PostgreSQL has
+        # analyzed the table
+        if not self.result_list.query.is_sliced:
+            limit = self.list_max_show_all if self.show_all else self.list_per_page
+            self.result_list = self.result_list[:limit]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    # Columns the changelist loads; the change form still loads whole rows
+    list_columns = ()
+
+    def get_changelist(self, request, **kwargs):
+        return ColumnsChangeList
+
+
+@admin.register(Feedback)
+class FeedbackAdmin(LargeTableAdmin):
+    list_display = ('id', 'timestamp', 'line', 'destination', 'geo_location')
+    list_select_related = ('line', 'destination')
+    list_columns = ('id', 'timestamp', 'geo_location', 'line__name', 'destination__name')
+    date_hierarchy = 'timestamp'
+    # Both walk the (timestamp, id) index
+    ordering = ('-timestamp', '-id')
+    raw_id_fields = ('verification',)
+
+
+@admin.register(EmailVerification)
+class EmailVerificationAdmin(LargeTableAdmin):
+    list_display = ('id', 'email', 'device_id', 'platform', 'verified', 'created_at', 'expires_at')
+    list_columns = list_display
+    list_filter = ('verified',)
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at', '-id')
+    # Exact matches, so that searching uses the email and token indexes
+    search_fields = ('=email', '=token')
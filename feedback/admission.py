@@ -0,0 +1,196 @@
+"""Per-endpoint admission control and load shedding.
+
+AdmissionControlMiddleware applies the ADMISSION_LIMITS of the URL name a
+request resolves to:
+
+* a concurrency limit shared by all worker processes on the host. Each slot
+  is a lock file in ADMISSION_LOCK_DIR held with flock() while the request
+  runs; the kernel releases it even if a worker dies. A request that finds no
+  free slot within its queue budget is answered with 503 and Retry-After.
+* a token bucket per device id (see DeviceIdentifier), kept in Django's cache.
+  Devices over their rate get 429 and Retry-After. A bucket is read and
+  written back under a flock()ed file in ADMISSION_LOCK_DIR, so concurrent
+  requests of the workers on the host cannot spend the same tokens.
+
+Shed requests are counted per URL name, see ``stats()``.
+"""
+import asyncio
+import fcntl
+import functools
+import math
+import os
+import random
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from .views import DeviceIdentifier
+
+# Pause between attempts to get a concurrency slot
+RETRY_INTERVAL = 0.005
+# Lock files the token buckets are spread over
+BUCKET_LOCKS = 64
+
+_stats_lock = threading.Lock()
+_shed = {}
+
+
+def _count_shed(url_name, reason):
+    with _stats_lock:
+        counts = _shed.setdefault(url_name, {'overloaded': 0, 'rate_limited': 0})
+        counts[reason] += 1
+
+
+def stats():
+    """Number of shed requests per URL name in this process."""
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _shed.items()}
+
+
+@functools.lru_cache(maxsize=256)
+def url_name_for(path):
+    try:
+        return resolve(path).url_name
+    except Resolver404:
+        return None
+
+
+class ConcurrencySlots:
+    """At most ``size`` holders at a time, across processes, using flock()ed files."""
+
+    def __init__(self, directory, name, size):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f'{name}.{index}') for index in range(size)]
+
+    def try_acquire(self):
+        """Return a file descriptor holding a slot, or None if all are taken."""
+        start = random.randrange(len(self.paths))
+        for path in self.paths[start:] + self.paths[:start]:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    @staticmethod
+    def release(fd):
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+def _take_token(bucket, now, rate, burst):
+    """Apply one request to a ``(tokens, timestamp)`` bucket.
+
+    Returns the new bucket and the seconds to wait (0 if the request may pass).
+    """
+    tokens, stamp = bucket or (burst, now)
+    tokens = min(burst, tokens + (now - stamp) * rate)
+    if tokens < 1:
+        return (tokens, now), (1 - tokens) / rate
+    return (tokens - 1, now), 0
+
+
+def take_token(key, rate, burst, timeout):
+    """Take a token from the bucket at cache ``key``; return the seconds to wait, 0 if there was one."""
+    path = os.path.join(settings.ADMISSION_LOCK_DIR, f'bucket.{zlib.crc32(key.encode()) % BUCKET_LOCKS}')
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        bucket, wait = _take_token(cache.get(key), time.time(), rate, burst)
+        cache.set(key, bucket, timeout)
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+    return wait
+
+
+def _shed_response(url_name, reason, retry_after):
+    _count_shed(url_name, reason)
+    if reason == 'rate_limited':
+        response = JsonResponse({'error': 'Too many requests'}, status=429)
+    else:
+        response = JsonResponse({'error': 'Server busy, please retry later'}, status=503)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+@sync_and_async_middleware
+def AdmissionControlMiddleware(get_response):
+    limits = settings.ADMISSION_LIMITS
+    os.makedirs(settings.ADMISSION_LOCK_DIR, exist_ok=True)
+    slots = {
+        name: ConcurrencySlots(settings.ADMISSION_LOCK_DIR, name, limit['concurrency'])
+        for name, limit in limits.items() if limit.get('concurrency')
+    }
+
+    def bucket_key(request, url_name):
+        return f"admission:{url_name}:{DeviceIdentifier().get_device_id(request)}"
+
+    def bucket_timeout(limit):
+        return math.ceil(limit['burst'] / limit['rate']) + 1
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            url_name = url_name_for(request.path_info)
+            limit = limits.get(url_name)
+            if limit is None:
+                return await get_response(request)
+
+            if limit.get('rate'):
+                # In a thread, so that the event loop never waits for the lock
+                wait = await sync_to_async(take_token, thread_sensitive=False)(
+                    bucket_key(request, url_name), limit['rate'], limit['burst'], bucket_timeout(limit),
+                )
+                if wait:
+                    return _shed_response(url_name, 'rate_limited', wait)
+
+            if url_name not in slots:
+                return await get_response(request)
+            deadline = time.monotonic() + limit.get('queue_ms', 0) / 1000
+            fd = slots[url_name].try_acquire()
+            while fd is None:
+                if time.monotonic() >= deadline:
+                    return _shed_response(url_name, 'overloaded', 1)
+                await asyncio.sleep(RETRY_INTERVAL)
+                fd = slots[url_name].try_acquire()
+            try:
+                return await get_response(request)
+            finally:
+                ConcurrencySlots.release(fd)
+    else:
+        def middleware(request):
+            url_name = url_name_for(request.path_info)
+            limit = limits.get(url_name)
+            if limit is None:
+                return get_response(request)
+
+            if limit.get('rate'):
+                wait = take_token(bucket_key(request, url_name), limit['rate'], limit['burst'], bucket_timeout(limit))
+                if wait:
+                    return _shed_response(url_name, 'rate_limited', wait)
+
+            if url_name not in slots:
+                return get_response(request)
+            deadline = time.monotonic() + limit.get('queue_ms', 0) / 1000
+            fd = slots[url_name].try_acquire()
+            while fd is None:
+                if time.monotonic() >= deadline:
+                    return _shed_response(url_name, 'overloaded', 1)
+                time.sleep(RETRY_INTERVAL)
+                fd = slots[url_name].try_acquire()
+            try:
+                return get_response(request)
+            finally:
+                ConcurrencySlots.release(fd)
+
+    return middleware
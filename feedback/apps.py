@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class FeedbackConfig(AppConfig):
+    name = 'feedback'
+
+    def ready(self):
+        from . import checks  # noqa: F401  Registers the system checks
@@ -0,0 +1,141 @@
+"""Async versions of the hot feedback endpoints, for ASGI deployments.
+
+feedback/urls.py routes check-token and submit-feedback here instead of the
+DRF views when FEEDBACK_ASYNC_VIEWS is on, which tratroubleBackend/asgi.py
+does. Token lookups use the async cache and ORM APIs, so one process can keep
+many slow client connections open without tying up a thread for each. The
+responses are the same as those of the views in feedback/views.py.
+
+Storing feedback still runs the synchronous ingestion code in a worker
+thread, since it needs a transaction, which the async ORM does not offer.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
+from rest_framework.renderers import JSONRenderer
+
+from . import access_tokens, ingestion, token_cache
+
+
+class AsyncIsValidTokenPermission:
+    """Async counterpart of IsValidTokenPermission."""
+
+    async def has_permission(self, request, view):
+        if request.method == 'GET':
+            token = request.GET.get('token')
+        else:
+            token = request.data.get('token')
+        if not token:
+            raise AuthenticationFailed('Token is required')
+        if access_tokens.is_access_token(token):
+            try:
+                claims = await access_tokens.averify(token, request.META.get('HTTP_X_DEVICE_ID'))
+            except access_tokens.InvalidAccessToken as exc:
+                raise AuthenticationFailed(str(exc))
+            request.verification_id = claims.verification_id
+            return True
+        if not isinstance(token, str):
+            # E.g. a number in the JSON body
+            raise AuthenticationFailed('Invalid token')
+        ev = await token_cache.aget_verification(token)
+        if ev is None:
+            raise AuthenticationFailed('Invalid token')
+        if not ev.verified:
+            raise PermissionDenied('Email not verified for this token')
+        if await access_tokens.ais_revoked(ev.id):
+            raise PermissionDenied('Access revoked')
+        request.email_verification = ev
+        request.verification_id = ev.id
+        return True
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    """``data`` rendered like a DRF Response, e.g. datetimes with microseconds, unlike JsonResponse."""
+    renderer = JSONRenderer()
+    return HttpResponse(renderer.render(data), content_type=renderer.media_type, status=status)
+
+
+def parse_data(request):
+    """Request body as a dict, like DRF's ``request.data`` for JSON and form posts."""
+    if request.content_type == 'application/json':
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError('JSON object expected')
+        return data
+    return request.POST
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAPIView(View):
+    """Minimal async stand-in for DRF's APIView: parses the body, checks permissions."""
+    permission_classes = []
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.data = parse_data(request) if request.method == 'POST' else {}
+        except ValueError as exc:
+            return json_response({'detail': f'JSON parse error - {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            for permission_class in self.permission_classes:
+                await permission_class().has_permission(request, self)
+        except (AuthenticationFailed, PermissionDenied) as exc:
+            # DRF answers both with 403 since the API has no WWW-Authenticate scheme
+            return json_response({'detail': str(exc.detail)}, status=status.HTTP_403_FORBIDDEN)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+def submit(verification_id, item):
+    ingestion.submit_feedback([ingestion.build_feedback(verification_id, item)])
+
+
+class AsyncSubmitFeedbackView(AsyncAPIView):
+    permission_classes = [AsyncIsValidTokenPermission]
+
+    async def post(self, request):
+        token = request.data.get('token')
+        line = request.data.get('line')
+        destination = request.data.get('destination')
+        geo_location = request.data.get('geo_location')
+
+        if not all([token, line, destination, geo_location]):
+            return json_response({'error': 'All fields are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        error = ingestion.validate_item(request.data)
+        if error:
+            return json_response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Building the row may look up its line and destination
+        await sync_to_async(submit)(request.verification_id, request.data)
+        return json_response({'message': 'Feedback submitted successfully'})
+
+
+class AsyncCheckTokenView(AsyncAPIView):
+    async def get(self, request):
+        token = request.GET.get('token')
+        if not token:
+            return json_response({'error': 'Token is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if access_tokens.is_access_token(token):
+            try:
+                await access_tokens.averify(token, request.META.get('HTTP_X_DEVICE_ID'))
+            except access_tokens.InvalidAccessToken as exc:
+                return json_response({'error': str(exc)}, status=exc.status_code)
+            return json_response({'message': 'ok'}, status=status.HTTP_200_OK)
+
+        ev = await token_cache.aget_verification(token)
+        if ev is None:
+            return json_response({'error': 'Unknown token'}, status=status.HTTP_404_NOT_FOUND)
+
+        if not ev.verified:
+            return json_response({'error': 'Email not verified for this token'}, status=status.HTTP_403_FORBIDDEN)
+
+        if await access_tokens.ais_revoked(ev.id):
+            return json_response({'error': 'Access revoked'}, status=status.HTTP_403_FORBIDDEN)
+
+        return json_response({'message': 'ok', **access_tokens.grant(ev)}, status=status.HTTP_200_OK)
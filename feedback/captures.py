@@ -0,0 +1,303 @@
+"""Durable, queryable store for the payloads posted to bad-json.
+
+BadJsonView hands every payload to the CaptureWriter of its process, which
+appends it as one JSON line to the process's current segment, a file
+``bad-json-<start time>-<host>-<pid>.ndjson.gz`` in BAD_JSON_DIR. A background
+thread writes everything that arrived within BAD_JSON_FLUSH_INTERVAL as one
+gzip member and fsyncs the file once per batch. A crash loses at most the
+last batch, and all complete members stay readable.
+
+A process starts a new segment once BAD_JSON_SEGMENT_BYTES (uncompressed)
+went into the current one. The oldest segments are deleted once all of them
+together exceed BAD_JSON_RETENTION_BYTES, or once they were last written to
+more than BAD_JSON_RETENTION_DAYS ago. A writer holds an flock() on its
+current segment until it moves on to the next one or exits, and retention
+skips segments it cannot lock, so that it never deletes a segment that
+another process is still writing to.
+
+``iter_records()`` reads the segments back for the ``bad_json`` command.
+"""
+import atexit
+import fcntl
+import glob
+import gzip
+import heapq
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'bad-json-'
+SUFFIX = '.ndjson.gz'
+
+# Seconds between retention checks of a process that does not rotate
+RETENTION_CHECK_INTERVAL = 3600
+
+
+def segment_paths(directory=None):
+    """All segments, in the order they were started."""
+    directory = directory or settings.BAD_JSON_DIR
+    paths = glob.glob(os.path.join(glob.escape(directory), f'{PREFIX}*{SUFFIX}'))
+    return sorted(paths, key=os.path.basename)
+
+
+def _remove_unless_open(path):
+    """Delete segment ``path`` unless a writer holds its lock. Returns whether it was deleted."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False  # Deleted by another process
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    finally:
+        os.close(fd)
+
+
+def enforce_retention(directory, max_bytes, max_age):
+    """Delete the oldest segments beyond ``max_bytes`` in total or ``max_age`` seconds. Returns the number deleted.
+
+    Segments still open in a writer are left alone.
+    """
+    segments = []
+    for path in segment_paths(directory):
+        try:
+            segments.append((path, os.stat(path)))
+        except FileNotFoundError:
+            continue  # Deleted by another process
+    total = sum(stat.st_size for _, stat in segments)
+    now = time.time()
+    deleted = 0
+    for path, stat in segments:
+        if total <= max_bytes and now - stat.st_mtime <= max_age:
+            continue
+        if _remove_unless_open(path):
+            deleted += 1
+            total -= stat.st_size
+    return deleted
+
+
+class CaptureWriter:
+    def __init__(self, directory, segment_bytes, flush_interval, queue_size, retention_bytes, retention_days):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_days * 86400
+        self.written = 0
+        self.dropped = 0
+        self._condition = threading.Condition()
+        self._pending = []  # Encoded lines
+        self._closed = False
+        self._file = None
+        self._path = None
+        self._segment_size = 0
+        self._retention_checked = 0.0
+        self._thread = threading.Thread(target=self._run, name='bad-json-capture', daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        """Queue ``record`` (a JSON-serializable dict); False if it was dropped."""
+        line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        with self._condition:
+            if self._closed or len(self._pending) >= self.queue_size:
+                self.dropped += 1
+                return False
+            self._pending.append(line)
+            if len(self._pending) == 1:
+                self._condition.notify()
+        return True
+
+    def close(self, timeout=10):
+        """Write out what is queued and close the current segment."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._closed:
+                    # Collect what arrives in the meantime; close() cuts this short
+                    self._condition.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    self.dropped += len(batch)
+                    logger.exception("Could not write %d bad-json payload(s)", len(batch))
+            if closed:
+                break
+        if self._file is not None:
+            self._file.close()
+
+    def _write(self, batch):
+        if self._file is None or self._segment_size >= self.segment_bytes:
+            self._rotate()
+        data = b''.join(batch)
+        self._file.write(gzip.compress(data, compresslevel=6))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._segment_size += len(data)
+        self.written += len(batch)
+        if time.monotonic() - self._retention_checked >= RETENTION_CHECK_INTERVAL:
+            self._enforce_retention()
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            started = datetime.now(dt_timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+            self._path = os.path.join(self.directory, f'{PREFIX}{started}-{socket.gethostname()}-{os.getpid()}{SUFFIX}')
+            self._file = open(self._path, 'ab')
+            # Held until the file is closed; keeps retention away from it
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                if os.path.samestat(os.stat(self._path), os.fstat(self._file.fileno())):
+                    break
+            except FileNotFoundError:
+                pass
+            # Deleted by a retention pass between open() and flock()
+            self._file.close()
+        self._segment_size = 0
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        self._retention_checked = time.monotonic()
+        enforce_retention(self.directory, self.retention_bytes, self.retention_seconds)
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """The writer of the current process, created on first use (also after a fork)."""
+    global _writer, _writer_pid
+    with _writer_lock:
+        if _writer is None or _writer_pid != os.getpid():
+            _writer = CaptureWriter(
+                settings.BAD_JSON_DIR,
+                settings.BAD_JSON_SEGMENT_BYTES,
+                settings.BAD_JSON_FLUSH_INTERVAL,
+                settings.BAD_JSON_QUEUE_SIZE,
+                settings.BAD_JSON_RETENTION_BYTES,
+                settings.BAD_JSON_RETENTION_DAYS,
+            )
+            _writer_pid = os.getpid()
+        return _writer
+
+
+def capture(token, target, payload, verification_id=None, device_id=''):
+    """Store a bad-json payload. Returns False if the queue was full."""
+    return get_writer().append({
+        'time': datetime.now(dt_timezone.utc).isoformat(),
+        'token': token,
+        'verification_id': verification_id,
+        'device_id': device_id,
+        'target': target,
+        'json': payload,
+    })
+
+
+def stats():
+    """Counters of this process's writer, or None if it was never used."""
+    if _writer is None or _writer_pid != os.getpid():
+        return None
+    return {'written': _writer.written, 'dropped': _writer.dropped}
+
+
+@atexit.register
+def shutdown():
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.close()
+
+
+# -- Reading ------------------------------------------------------------------
+
+def read_segment(path):
+    """The records of one segment. Stops at a member that is still being written."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+    except FileNotFoundError:
+        return  # Deleted by retention in the meantime
+    except (EOFError, gzip.BadGzipFile, zlib.error):
+        return
+
+
+def _segment_may_match(path, since, until):
+    # Segments are named after the time they were started and last written at their mtime
+    if until is not None:
+        started = os.path.basename(path)[len(PREFIX):].split('-', 1)[0]
+        if datetime.strptime(started, '%Y%m%dT%H%M%S%fZ').replace(tzinfo=dt_timezone.utc) >= until:
+            return False
+    if since is not None:
+        try:
+            if os.stat(path).st_mtime < since.timestamp():
+                return False
+        except FileNotFoundError:
+            return False
+    return True
+
+
+def matches(record, tokens=(), verification_ids=(), target=None, since=None, until=None):
+    """Whether ``record`` passes the filters of iter_records()."""
+    if (tokens or verification_ids) and not (
+        record.get('token') in tokens or record.get('verification_id') in verification_ids
+    ):
+        return False
+    if target is not None and target not in str(record.get('target', '')):
+        return False
+    if since is not None or until is not None:
+        recorded = datetime.fromisoformat(record['time'])
+        if since is not None and recorded < since:
+            return False
+        if until is not None and recorded >= until:
+            return False
+    return True
+
+
+def iter_records(tokens=(), verification_ids=(), target=None, since=None, until=None, directory=None):
+    """Stored records matching all given filters, segment by segment.
+
+    ``tokens`` and ``verification_ids`` match records sent with any of them;
+    ``target`` matches as a substring; ``since``/``until`` are aware datetimes.
+    """
+    for path in segment_paths(directory):
+        if not _segment_may_match(path, since, until):
+            continue
+        for record in read_segment(path):
+            if matches(record, tokens, verification_ids, target, since, until):
+                yield record
+
+
+def last_records(limit, **filters):
+    """The ``limit`` most recent matching records, oldest first."""
+    return sorted(heapq.nlargest(limit, iter_records(**filters), key=lambda record: record['time']),
+                  key=lambda record: record['time'])
@@ -0,0 +1,36 @@
+"""System checks of the deployment settings."""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+# Cache backends private to each process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def replicas_need_shared_cache(app_configs, **kwargs):
+    """Read replicas rely on marks in the cache that every process must see, see feedback.replicas."""
+    if settings.DATABASE_REPLICAS and settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+        return [Error(
+            'Read replicas are configured, but the cache is private to each process.',
+            hint=("After verify-email, another worker would read the token from a lagging replica and cache "
+                  "it as unverified. Set TRATROUBLE_CACHE_BACKEND to a shared backend, e.g. "
+                  "django.core.cache.backends.filebased.FileBasedCache, Memcached or Redis."),
+            id='feedback.E001',
+        )]
+    return []
+
+
+@register()
+def pool_available(app_configs, **kwargs):
+    if (settings.DATABASE_ENGINE == 'postgresql' and settings.DATABASE_POOL
+            and 'pool' not in settings.DATABASES['default'].get('OPTIONS', {})):
+        return [Warning(
+            'TRATROUBLE_DATABASE_POOL is on, but psycopg 3 or psycopg_pool is not installed.',
+            hint=('Connections are kept open for TRATROUBLE_CONN_MAX_AGE instead of being pooled. '
+                  'Install the psycopg packages of requirements.txt, or set TRATROUBLE_DATABASE_POOL=False.'),
+            id='feedback.W001',
+        )]
+    return []
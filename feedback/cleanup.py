@@ -0,0 +1,68 @@
+"""Removal of rows that are no longer needed, in small batches.
+
+Each batch is deleted in its own short transaction so that the sweep never
+holds SQLite's write lock for long and requests keep getting through.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import outbox, token_cache
+from .models import EmailVerification, IdempotencyKey, OutboxEmail
+
+
+def sweep_verifications(batch_size=500, pause=0.0, now=None):
+    """Delete expired, unverified EmailVerification rows. Returns the number removed."""
+    now = now or timezone.now()
+    expired = EmailVerification.objects.filter(verified=False, expires_at__lt=now)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(expired.values_list('id', 'token')[:batch_size])
+            if not batch:
+                break
+            EmailVerification.objects.filter(id__in=[id for id, _ in batch]).delete()
+        token_cache.forget(*[token for _, token in batch])
+        deleted += len(batch)
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def sweep_idempotency_keys(batch_size=500, pause=0.0, now=None):
+    """Delete IdempotencyKey rows past their expiry. Returns the number removed."""
+    now = now or timezone.now()
+    expired = IdempotencyKey.objects.filter(expires_at__lt=now)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(expired.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            IdempotencyKey.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def sweep_abandoned_emails(batch_size=500, pause=0.0, now=None):
+    """Delete outbox emails given up more than EMAIL_OUTBOX_ABANDONED_RETENTION ago. Returns the number removed."""
+    now = now or timezone.now()
+    expired = outbox.abandoned().filter(
+        next_attempt_at__lt=now - timedelta(seconds=settings.EMAIL_OUTBOX_ABANDONED_RETENTION),
+    )
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(expired.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            OutboxEmail.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
+    return deleted
@@ -0,0 +1,98 @@
+"""Streaming export of Feedback as NDJSON or CSV.
+
+Rows are read in keyset-paginated chunks on ``id`` and encoded one chunk at a
+time, so memory use does not depend on the size of the table. Used by the
+``export_feedback`` management command and ExportFeedbackView.
+"""
+import csv
+import io
+import json
+import zlib
+
+from .models import Feedback
+
+EXPORT_FIELDS = ('id', 'timestamp', 'line', 'destination', 'geo_location', 'latitude', 'longitude')
+# What EXPORT_FIELDS are read from; lines and destinations are stored as references
+EXPORT_COLUMNS = ('id', 'timestamp', 'line__name', 'destination__name', 'geo_location', 'latitude', 'longitude')
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Size of the blocks handed to the response or file
+BLOCK_SIZE = 64 * 1024
+
+
+def iter_rows(since_id=None, since=None, chunk_size=2000):
+    """Yield tuples of EXPORT_FIELDS ordered by id, starting after ``since_id``."""
+    qs = Feedback.objects.order_by('id').values_list(*EXPORT_COLUMNS)
+    if since is not None:
+        qs = qs.filter(timestamp__gte=since)
+    last_id = since_id or 0
+    while True:
+        # Fetch each chunk completely so no cursor stays open while the
+        # consumer (e.g. a slow HTTP client) processes the rows.
+        chunk = list(qs.filter(id__gt=last_id)[:chunk_size].iterator())
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1][0]
+
+
+def _values(row):
+    return [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, _values(row)))) + '\n'
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(EXPORT_FIELDS)
+    for row in rows:
+        yield line(_values(row))
+
+
+def _blocks(lines):
+    block = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        block.append(data)
+        size += len(data)
+        if size >= BLOCK_SIZE:
+            yield b''.join(block)
+            block = []
+            size = 0
+    if block:
+        yield b''.join(block)
+
+
+def _gzipped(blocks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(rows, fmt='ndjson', gzip=False):
+    """Encode ``rows`` as blocks of bytes in the given format."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}")
+    lines = _ndjson_lines(rows) if fmt == 'ndjson' else _csv_lines(rows)
+    blocks = _blocks(lines)
+    return _gzipped(blocks) if gzip else blocks
@@ -0,0 +1,138 @@
+"""Helpers for the coordinates stored with each Feedback.
+
+The free-form ``geo_location`` string is parsed into latitude/longitude when
+feedback is stored, together with its geohash (``geo_cell``). Geohashes of
+nearby points share a prefix and sort in the same order as their base32
+alphabet, so "all rows in this cell" is an index range scan on ``geo_cell``.
+"""
+import math
+import re
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision of the stored geo_cell; 9 characters are cells of roughly 5 x 5 m
+GEO_CELL_PRECISION = 9
+
+# Sorts after every geohash character, used as exclusive upper bound of a prefix
+PREFIX_END = '~'
+
+EARTH_RADIUS_M = 6371000
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def parse_geo_location(value):
+    """Return ``(latitude, longitude)`` for strings like "52.52,13.40", or None."""
+    numbers = _NUMBER.findall(value or '')
+    if len(numbers) != 2:
+        return None
+    latitude, longitude = float(numbers[0]), float(numbers[1])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def encode(latitude, longitude, precision=GEO_CELL_PRECISION):
+    """Geohash of a point."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            interval, coordinate = lon_range, longitude
+        else:
+            interval, coordinate = lat_range, latitude
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """``(height, width)`` in degrees of a geohash cell."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(south, west, north, east, max_cells=32):
+    """Geohash prefixes whose cells together cover the bounding box.
+
+    Uses the finest precision that needs at most ``max_cells`` cells.
+    """
+    for precision in range(GEO_CELL_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor((north + 90) / height) - math.floor((south + 90) / height) + 1
+        columns = math.floor((east + 180) / width) - math.floor((west + 180) / width) + 1
+        if rows * columns <= max_cells:
+            break
+
+    cells = set()
+    latitude = south
+    while True:
+        longitude = west
+        while True:
+            cells.add(encode(latitude, longitude, precision))
+            if longitude >= east:
+                break
+            longitude = min(longitude + width, east)
+        if latitude >= north:
+            break
+        latitude = min(latitude + height, north)
+    return sorted(cells)
+
+
+def cell_ranges(cells):
+    """Merge sorted geohash prefixes into ``(start, end)`` ranges of geo_cell.
+
+    Neighbouring prefixes like "u336w".."u336z" become a single range, which
+    keeps the number of index range scans down.
+    """
+    ranges = []
+    for cell in cells:
+        if ranges:
+            start, last = ranges[-1]
+            index = GEOHASH_ALPHABET.index(last[-1])
+            if (len(last) == len(cell) and last[:-1] == cell[:-1]
+                    and index + 1 < len(GEOHASH_ALPHABET) and GEOHASH_ALPHABET[index + 1] == cell[-1]):
+                ranges[-1] = (start, cell)
+                continue
+        ranges.append((cell, cell))
+    return [(start, last + PREFIX_END) for start, last in ranges]
+
+
+def bounding_box(latitude, longitude, radius_m):
+    """``(south, west, north, east)`` of the square around a point."""
+    lat_delta = math.degrees(radius_m / EARTH_RADIUS_M)
+    lon_delta = lat_delta / max(math.cos(math.radians(latitude)), 1e-6)
+    return (
+        max(latitude - lat_delta, -90.0),
+        max(longitude - lon_delta, -180.0),
+        min(latitude + lat_delta, 90.0),
+        min(longitude + lon_delta, 180.0),
+    )
+
+
+def locate(geo_location):
+    """``(latitude, longitude, geo_cell)`` for a raw geo_location string.
+
+    Unparseable strings give ``(None, None, '')``; the raw value is kept either way.
+    """
+    coordinates = parse_geo_location(geo_location)
+    if coordinates is None:
+        return None, None, ''
+    latitude, longitude = coordinates
+    return latitude, longitude, encode(latitude, longitude)
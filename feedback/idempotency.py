@@ -0,0 +1,161 @@
+"""Idempotency-Key support for POST requests.
+
+Apps retry submissions on flaky connections. When a POST carries an
+``Idempotency-Key`` header, IdempotencyMiddleware records the key in the
+IdempotencyKey table before running the view, with a unique constraint so
+that only one of several concurrent requests with the same key gets to run
+it. The others are answered with 409 and Retry-After while it runs. Once it
+has completed successfully, its response is stored for IDEMPOTENCY_KEY_TTL
+seconds and replayed to every retry without running the view again.
+
+Keys are scoped to the path and the X-Device-ID header. Reusing a key for a
+different request body is answered with 422. Responses other than 2xx are
+not stored, so a request that failed can be retried with the same key.
+Expired keys are deleted by the ``sweep_expired`` command.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+# Seconds a retry is asked to wait while the first request is still running
+RETRY_AFTER = 1
+
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _error(message, status, **headers):
+    response = JsonResponse({'error': message}, status=status)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.body), status=record.status_code, content_type=record.content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _take_over(record, fingerprint, now):
+    """Reset an expired or abandoned record for a new run; False if another request was faster."""
+    return bool(_run(record).update(
+        fingerprint=fingerprint, created_at=now, expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+        completed=False, status_code=None, content_type='', body=b'',
+    ))
+
+
+def begin(request):
+    """Claim the request's key. Returns ``(record, None)`` if the view should run,
+    ``(None, response)`` if the request is answered from the store (or rejected),
+    and ``(None, None)`` if the request has no key.
+    """
+    header = request.META.get(HEADER)
+    if request.method != 'POST' or not header:
+        return None, None
+    if len(header) > MAX_KEY_LENGTH:
+        return None, _error(f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters', 400)
+    key = _hash(header, request.path_info, request.META.get('HTTP_X_DEVICE_ID', ''))
+    fingerprint = _hash(request.body)
+
+    for _ in range(2):  # Once more if the existing record disappears in between
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    key=key, fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                ), None
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            continue
+        abandoned = (
+            not record.completed
+            and record.created_at <= now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        )
+        if record.expires_at <= now or abandoned:
+            if _take_over(record, fingerprint, now):
+                record.created_at = now
+                return record, None
+            break
+        if record.fingerprint != fingerprint:
+            return None, _error('Idempotency-Key was already used for a different request', 422)
+        if record.completed:
+            return None, _replay(record)
+        break
+    return None, _error('A request with this Idempotency-Key is in progress', 409, **{'Retry-After': RETRY_AFTER})
+
+
+def _run(record):
+    # The created_at check keeps a request that outlived IDEMPOTENCY_LOCK_TIMEOUT
+    # from touching the record of the retry that took over
+    return IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at)
+
+
+def finish(record, response):
+    """Store a successful response for replay, or release the key so the request can be retried."""
+    if 200 <= response.status_code < 300 and not response.streaming:
+        _run(record).update(
+            completed=True, status_code=response.status_code,
+            content_type=response.get('Content-Type', ''), body=response.content,
+        )
+    else:
+        abort(record)
+
+
+def abort(record):
+    _run(record).delete()
+
+
+@sync_and_async_middleware
+def IdempotencyMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if request.method != 'POST' or HEADER not in request.META:
+                return await get_response(request)
+            record, response = await sync_to_async(begin)(request)
+            if response is not None:
+                return response
+            if record is None:
+                return await get_response(request)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                await sync_to_async(abort)(record)
+                raise
+            await sync_to_async(finish)(record, response)
+            return response
+    else:
+        def middleware(request):
+            record, response = begin(request)
+            if response is not None:
+                return response
+            if record is None:
+                return get_response(request)
+            try:
+                response = get_response(request)
+            except BaseException:
+                abort(record)
+                raise
+            finish(record, response)
+            return response
+
+    return middleware
@@ -0,0 +1,75 @@
+"""Validation and storage of submitted feedback.
+
+Shared by SubmitFeedbackView and SubmitFeedbackBatchView so that a single
+submission and every item of a batch go through the same checks and end up
+in the database the same way.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import geo, interning, rollups
+from .models import Destination, Feedback, Line
+
+FEEDBACK_FIELDS = ('line', 'destination', 'geo_location')
+MAX_LENGTHS = {
+    'line': Line._meta.get_field('name').max_length,
+    'destination': Destination._meta.get_field('name').max_length,
+    'geo_location': Feedback._meta.get_field('geo_location').max_length,
+}
+
+# Seconds a request waits for its rows to be flushed in write-behind mode
+WRITE_BEHIND_WAIT_TIMEOUT = 30
+
+
+def validate_item(item):
+    """Return an error message for an invalid feedback item, or None."""
+    if not isinstance(item, dict):
+        return 'Item must be an object'
+    if not all(item.get(field) for field in FEEDBACK_FIELDS):
+        return 'All fields are required'
+    for field in FEEDBACK_FIELDS:
+        max_length = MAX_LENGTHS[field]
+        if len(str(item[field])) > max_length:
+            return f'{field} must be at most {max_length} characters'
+    return None
+
+
+def build_feedback(verification_id, item):
+    """Unsaved Feedback for a validated item, submitted under EmailVerification ``verification_id``.
+
+    Looks up (or creates) the item's Line and Destination, so it needs the database
+    the first time a process sees a name.
+    """
+    # Apps send numbers and lists as well, which were always stored as text
+    geo_location = str(item['geo_location'])
+    latitude, longitude, geo_cell = geo.locate(geo_location)
+    return Feedback(
+        verification_id=verification_id,
+        line=interning.line(str(item['line'])),
+        destination=interning.destination(str(item['destination'])),
+        geo_location=geo_location,
+        latitude=latitude,
+        longitude=longitude,
+        geo_cell=geo_cell,
+    )
+
+
+def store_feedback(rows):
+    """Insert ``rows`` with a single bulk insert and update the rollups, in one transaction."""
+    if not rows:
+        return rows
+    with transaction.atomic():
+        rows = Feedback.objects.bulk_create(rows)
+        rollups.record(rows)
+    return rows
+
+
+def submit_feedback(rows):
+    """Store ``rows`` directly, or through the write-behind buffer if it is enabled."""
+    if not settings.FEEDBACK_WRITE_BEHIND:
+        return store_feedback(rows)
+    from . import write_behind
+    future = write_behind.get_buffer().submit(rows)
+    if settings.FEEDBACK_WRITE_BEHIND_WAIT:
+        future.result(timeout=WRITE_BEHIND_WAIT_TIMEOUT)
+    return rows
@@ -0,0 +1,58 @@
+"""In-process cache of the Line and Destination rows that Feedback refers to.
+
+There are only a few hundred distinct lines and destinations, so every process
+keeps the rows it has seen in a dict and only goes to the database for a name
+it has not seen before. Rows are cached once their transaction has committed,
+so a rolled back insert never leaves a dangling id in the cache.
+"""
+from functools import partial
+
+from django.db import transaction
+
+from .models import Destination, Line
+
+# Names kept per table; the cache starts over when it grows beyond this
+MAX_ENTRIES = 10000
+
+_caches = {Line: {}, Destination: {}}
+
+
+def _remember(cache, name, row):
+    if len(cache) >= MAX_ENTRIES:
+        cache.clear()
+    cache[name] = row
+
+
+def intern(model, name):
+    """The ``model`` row (Line or Destination) for ``name``, created if needed."""
+    cache = _caches[model]
+    row = cache.get(name)
+    if row is None:
+        row, _ = model.objects.get_or_create(name=name)
+        transaction.on_commit(partial(_remember, cache, name, row))
+    return row
+
+
+def find(model, name):
+    """The existing ``model`` row for ``name``, or None. Never creates one."""
+    cache = _caches[model]
+    row = cache.get(name)
+    if row is None:
+        row = model.objects.filter(name=name).first()
+        if row is not None:
+            transaction.on_commit(partial(_remember, cache, name, row))
+    return row
+
+
+def line(name):
+    return intern(Line, name)
+
+
+def destination(name):
+    return intern(Destination, name)
+
+
+def clear():
+    """Forget all cached rows, e.g. after the lookup tables were edited by hand."""
+    for cache in _caches.values():
+        cache.clear()
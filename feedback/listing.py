@@ -0,0 +1,98 @@
+"""Keyset-paginated listing of Feedback, newest first.
+
+Pages are ordered by ``(timestamp, id)`` descending and continue after the
+last row of the previous page, handed to the client as an opaque cursor, so
+every page is a range scan on one of the ``(timestamp, id)`` indexes no
+matter how deep the client pages. Used by FeedbackListView.
+
+The timestamp of a row is taken when it is inserted, before its transaction
+commits, so a row can become visible after rows with later timestamps, and
+ids do not follow commit order on PostgreSQL either. Rows newer than
+FEEDBACK_LIST_SETTLE_SECONDS are therefore left out of the listing until
+every transaction that could still commit an older row has ended; after
+that, a page's rows never change.
+
+Feedback rows are only ever inserted, so the newest listed row matching a
+filter identifies the state of every page of that filter. FeedbackListView derives
+its ETag and Last-Modified from it and answers unchanged pages with 304
+without reading them.
+"""
+import base64
+import binascii
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import interning
+from .export import EXPORT_COLUMNS, EXPORT_FIELDS
+from .models import Destination, Feedback, Line
+
+ORDERING = ('-timestamp', '-id')
+
+
+def encode_cursor(timestamp, pk):
+    return base64.urlsafe_b64encode(f'{timestamp.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The ``(timestamp, id)`` of ``cursor``. Raises ValueError if it is malformed."""
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = value.split('|')
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(cursor)
+    timestamp = parse_datetime(timestamp)
+    if timestamp is None:
+        raise ValueError(cursor)
+    return timestamp, int(pk)
+
+
+def filtered(line=None, destination=None, since=None, until=None):
+    """Settled feedback matching the filters, or None if a line or destination does not exist."""
+    if settings.FEEDBACK_LIST_SETTLE_SECONDS:
+        settled = timezone.now() - timedelta(seconds=settings.FEEDBACK_LIST_SETTLE_SECONDS)
+        until = settled if until is None else min(until, settled)
+    qs = Feedback.objects.between(since, until)
+    if line is not None:
+        row = interning.find(Line, line)
+        if row is None:
+            return None
+        qs = qs.filter(line=row)
+    if destination is not None:
+        row = interning.find(Destination, destination)
+        if row is None:
+            return None
+        qs = qs.filter(destination=row)
+    return qs
+
+
+def newest(qs):
+    """``(timestamp, id)`` of the newest row of ``qs``, or None if it is empty."""
+    if qs is None:
+        return None
+    return qs.order_by(*ORDERING).values_list('timestamp', 'id').first()
+
+
+def etag(newest_row, params):
+    """Strong validator of the page selected by ``params`` while ``newest_row`` is the newest row."""
+    digest = hashlib.sha256(repr((newest_row, sorted(params.items()))).encode())
+    return digest.hexdigest()[:32]
+
+
+def page(qs, cursor=None, limit=100):
+    """Up to ``limit`` rows (dicts of EXPORT_FIELDS) after ``cursor`` and the cursor of the next page."""
+    if qs is None:
+        return [], None
+    if cursor is not None:
+        timestamp, pk = cursor
+        qs = qs.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    rows = list(qs.order_by(*ORDERING).values_list(*EXPORT_COLUMNS)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    return [dict(zip(EXPORT_FIELDS, row)) for row in rows], next_cursor
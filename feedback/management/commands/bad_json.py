@@ -0,0 +1,89 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from feedback import captures
+from feedback.models import EmailVerification
+
+
+def _datetime(value, option):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise CommandError(f"Invalid {option} value {value!r}")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+class Command(BaseCommand):
+    help = ("Search the captured bad-json payloads and print them as NDJSON. "
+            "With --follow, keep printing new payloads as they are captured.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--token', action='append', default=[],
+                            help="Payloads sent with this token. A verification token also matches "
+                                 "payloads sent with the access tokens of its verification.")
+        parser.add_argument('--target', help="Payloads whose target contains this string.")
+        parser.add_argument('--since', help="Payloads captured at or after this ISO 8601 time.")
+        parser.add_argument('--until', help="Payloads captured before this ISO 8601 time.")
+        parser.add_argument('--tail', type=int, metavar='N', help="Only the N most recent matching payloads.")
+        parser.add_argument('--follow', '-f', action='store_true', help="Keep running and print new payloads.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds between checks with --follow.")
+        parser.add_argument('--dir', default=settings.BAD_JSON_DIR, help="Segment directory (default: BAD_JSON_DIR).")
+
+    def handle(self, *args, **options):
+        filters = {
+            'tokens': frozenset(options['token']),
+            'verification_ids': frozenset(
+                EmailVerification.objects.filter(token__in=options['token']).values_list('id', flat=True)
+            ),
+            'target': options['target'],
+            'since': _datetime(options['since'], '--since') if options['since'] else None,
+            'until': _datetime(options['until'], '--until') if options['until'] else None,
+        }
+
+        # Segment sizes before the search, so --follow picks up exactly what came after
+        sizes = {path: self._size(path) for path in captures.segment_paths(options['dir'])}
+        seen = {path: sum(1 for _ in captures.read_segment(path)) for path in sizes} if options['follow'] else {}
+
+        if options['tail'] is not None:
+            records = captures.last_records(options['tail'], directory=options['dir'], **filters)
+        else:
+            records = captures.iter_records(directory=options['dir'], **filters)
+        for record in records:
+            self._print(record)
+
+        if options['follow']:
+            try:
+                self._follow(options['dir'], options['interval'], filters, sizes, seen)
+            except KeyboardInterrupt:
+                pass
+
+    def _follow(self, directory, interval, filters, sizes, seen):
+        while True:
+            time.sleep(interval)
+            for path in captures.segment_paths(directory):
+                size = self._size(path)
+                if size == sizes.get(path):
+                    continue
+                sizes[path] = size
+                skip = seen.get(path, 0)
+                count = 0
+                for count, record in enumerate(captures.read_segment(path), 1):
+                    if count > skip and captures.matches(record, **filters):
+                        self._print(record)
+                seen[path] = max(skip, count)
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return None
+
+    def _print(self, record):
+        self.stdout.write(json.dumps(record, ensure_ascii=False))
+        self.stdout.flush()
@@ -0,0 +1,52 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from feedback import export
+
+
+class Command(BaseCommand):
+    help = ("Export feedback as NDJSON or CSV without loading the table into memory. "
+            "Use --since-id with the last exported id for incremental exports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='ndjson')
+        parser.add_argument('--output', '-o', help="File to write to (default: stdout).")
+        parser.add_argument('--since-id', type=int, help="Only export feedback with a larger id.")
+        parser.add_argument('--since', help="Only export feedback submitted at or after this ISO 8601 time.")
+        parser.add_argument('--gzip', action='store_true', help="Gzip the output.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since value {options['since']!r}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        count = 0
+        last_id = options['since_id']
+
+        def rows():
+            nonlocal count, last_id
+            for row in export.iter_rows(options['since_id'], since, options['chunk_size']):
+                count += 1
+                last_id = row[0]
+                yield row
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for block in export.stream(rows(), options['format'], options['gzip']):
+                output.write(block)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
+
+        # Data may go to stdout, so report on stderr
+        self.stderr.write(f"Exported {count} feedback row(s), last id {last_id}")
@@ -0,0 +1,78 @@
+import io
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from feedback import profiling
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+
+class Command(BaseCommand):
+    help = ("List the request profiles captured by the profiling middleware, or with --summary, "
+            "the functions and SQL statements that took the most time per view.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--summary', action='store_true', help="Summarize the profiles per view.")
+        parser.add_argument('--view', action='append', default=[],
+                            help="Only profiles of this view (URL name, e.g. submit-feedback).")
+        parser.add_argument('--last', type=int, metavar='N', help="Only the N most recent profiles.")
+        parser.add_argument('--top', type=int, default=15, help="Functions and statements shown per view.")
+        parser.add_argument('--sort', choices=SORT_KEYS, default='cumulative', help="Order of the functions.")
+        parser.add_argument('--header', action='store_true',
+                            help="Print an X-Tratrouble-Profile header value that has a request profiled.")
+        parser.add_argument('--dir', default=settings.PROFILING_DIR, help="Profile directory (default: PROFILING_DIR).")
+
+    def handle(self, *args, **options):
+        if options['header']:
+            self.stdout.write(f"X-Tratrouble-Profile: {profiling.header_value()}")
+            return
+        if not settings.PROFILING_ENABLED:
+            self.stderr.write("Note: TRATROUBLE_PROFILING is off, no new profiles are captured.")
+
+        records = profiling.load(options['dir'])
+        if options['view']:
+            records = [record for record in records if record['view'] in options['view']]
+        if options['last'] is not None:
+            if options['last'] < 1:
+                raise CommandError("--last must be at least 1")
+            records = records[-options['last']:]
+        if not records:
+            self.stdout.write("No profiles.")
+            return
+
+        if options['summary']:
+            self._summary(records, options)
+        else:
+            for record in records:
+                self.stdout.write(
+                    f"{record['id']}  {record['time']}  {record['view']}  {record['method']} {record['path']}  "
+                    f"{record['status']}  {record['duration'] * 1000:.1f} ms  "
+                    f"{record['queries']} queries in {record['query_seconds'] * 1000:.1f} ms  ({record['trigger']})"
+                )
+
+    def _summary(self, records, options):
+        by_view = {}
+        for record in records:
+            by_view.setdefault(record['view'], []).append(record)
+        for view, view_records in sorted(by_view.items()):
+            durations = sorted(record['duration'] for record in view_records)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{view}: {len(view_records)} profiles, median {durations[len(durations) // 2] * 1000:.1f} ms, "
+                f"max {durations[-1] * 1000:.1f} ms"
+            ))
+
+            stats = profiling.function_stats(view_records, options['dir'])
+            if stats is not None:
+                # pstats prints to a stream in pieces; collect them first
+                out = io.StringIO()
+                stats.stream = out
+                stats.strip_dirs().sort_stats(options['sort']).print_stats(options['top'])
+                self.stdout.write(out.getvalue().strip('\n'))
+
+            statements = profiling.top_statements(view_records, options['top'])
+            if statements:
+                self.stdout.write("\n  SQL (count, total ms, statement):")
+                for sql, count, seconds in statements:
+                    self.stdout.write(f"  {count:>6} {seconds * 1000:>10.1f}  {sql}")
+            self.stdout.write("")
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from feedback import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-line/per-destination feedback rollups from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = rollups.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f"Rebuilt {total} rollup bucket(s) in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from feedback import access_tokens
+from feedback.models import EmailVerification, RevokedAccess
+
+
+class Command(BaseCommand):
+    help = ("Revoke (or with --undo, restore) access of verifications, including their signed "
+            "access tokens. Running workers pick the change up within "
+            "ACCESS_TOKEN_REVOCATION_REFRESH seconds.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='*', help="Revoke all verifications of these email addresses.")
+        parser.add_argument('--token', action='append', default=[], help="Verification token to revoke.")
+        parser.add_argument('--reason', default='')
+        parser.add_argument('--undo', action='store_true', help="Restore access instead.")
+
+    def handle(self, *args, **options):
+        if not options['emails'] and not options['token']:
+            raise CommandError("Give at least one email address or --token")
+        verifications = list(
+            EmailVerification.objects.filter(email__in=options['emails'])
+            | EmailVerification.objects.filter(token__in=options['token'])
+        )
+        if not verifications:
+            raise CommandError("No matching verifications")
+
+        if options['undo']:
+            deleted, _ = RevokedAccess.objects.filter(verification__in=verifications).delete()
+            self.stdout.write(f"Restored access of {deleted} verification(s)")
+        else:
+            RevokedAccess.objects.bulk_create(
+                [RevokedAccess(verification=ev, reason=options['reason']) for ev in verifications],
+                ignore_conflicts=True,
+            )
+            self.stdout.write(f"Revoked access of {len(verifications)} verification(s)")
+        access_tokens.reload_revocations()
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from feedback import outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails over a reused SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Send one batch and exit.")
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=settings.EMAIL_OUTBOX_POLL_SECONDS,
+                            help="Seconds to sleep when there is nothing to send.")
+
+    def handle(self, *args, **options):
+        connection = get_connection(fail_silently=False)
+        try:
+            while True:
+                sent, failed = outbox.send_pending(connection, options['batch_size'])
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent} email(s), {failed} failed")
+                if options['once']:
+                    break
+                if sent + failed < options['batch_size']:
+                    # Queue drained: don't hold the relay connection while idle
+                    outbox.close_quietly(connection)
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            outbox.close_quietly(connection)
@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from tratroubleBackend import startup
+
+GUNICORN_CONFIG = 'python:tratroubleBackend.gunicorn_conf'
+WSGI_APPLICATION = 'tratroubleBackend.wsgi:application'
+
+
+class Command(BaseCommand):
+    help = ("Container entry point: run collectstatic and migrate if anything changed, then "
+            "replace this process with gunicorn, which preloads and warms up the app. "
+            "Arguments after -- are passed on to gunicorn.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-static', action='store_true', help="Don't check the static files.")
+        parser.add_argument('--skip-migrate', action='store_true', help="Don't check for unapplied migrations.")
+        parser.add_argument('--prepare-only', action='store_true', help="Exit instead of starting gunicorn.")
+        parser.add_argument('gunicorn_args', nargs='*', help="Extra gunicorn arguments, e.g. -- --workers 4")
+
+    def handle(self, *args, **options):
+        started = time.time()
+        verbosity = options['verbosity']
+        timings = {}
+        if not options['skip_static']:
+            with startup.timed(timings, 'collectstatic'):
+                ran = startup.collect_static(verbosity)
+            self._report('collectstatic', ran, timings)
+        if not options['skip_migrate']:
+            with startup.timed(timings, 'migrate'):
+                ran = startup.migrate(verbosity)
+            self._report('migrate', ran, timings)
+        if options['prepare_only']:
+            return
+
+        os.environ[startup.STARTED_ENV] = str(started)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        command = [sys.executable, '-m', 'gunicorn', '-c', GUNICORN_CONFIG, *options['gunicorn_args'], WSGI_APPLICATION]
+        os.execv(sys.executable, command)
+
+    def _report(self, step, ran, timings):
+        state = 'done' if ran else 'skipped, nothing changed'
+        self.stdout.write(f"{step}: {state} ({timings[step]:.2f} s)")
@@ -0,0 +1,85 @@
+import socketserver
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP to accept and discard messages."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        self.reply('220 tratrouble smtp sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().split(' ', 1)[0].upper()
+            if command == 'EHLO':
+                self.reply('250-tratrouble')
+                self.reply('250 AUTH PLAIN')
+            elif command == 'HELO':
+                self.reply('250 tratrouble')
+            elif command == 'AUTH':
+                # Any credentials are fine
+                self.reply('235 Authentication successful')
+            elif command in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                for data in self.rfile:
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                    size += len(data)
+                if server.delay:
+                    time.sleep(server.delay)
+                server.received += 1
+                if server.verbose:
+                    server.stdout.write(f"Received message {server.received} ({size} bytes)")
+                self.reply('250 OK: queued')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, delay=0.0, verbose=False, stdout=None):
+        super().__init__(address, SinkHandler)
+        self.delay = delay
+        self.verbose = verbose
+        self.stdout = stdout
+        self.received = 0
+
+
+class Command(BaseCommand):
+    help = ("Run a local SMTP server that accepts and discards all mail. Point "
+            "TRATROUBLE_EMAIL_HOST/PORT at it (with TRATROUBLE_EMAIL_USE_TLS=False) for testing.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--delay', type=float, default=0.0,
+                            help="Seconds to wait before accepting each message, to simulate a slow relay.")
+        parser.add_argument('--quiet', action='store_true')
+
+    def handle(self, *args, **options):
+        server = SinkServer(
+            (options['host'], options['port']),
+            delay=options['delay'], verbose=not options['quiet'], stdout=self.stdout,
+        )
+        self.stdout.write(f"SMTP sink listening on {options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
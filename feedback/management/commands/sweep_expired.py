@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from feedback import cleanup
+
+
+class Command(BaseCommand):
+    help = ("Delete expired, unverified email verifications, expired idempotency keys and long abandoned "
+            "outbox emails in small batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help="Seconds to sleep between batches, giving other writers a chance.")
+        parser.add_argument('--every', type=float, metavar='SECONDS',
+                            help="Keep running and sweep every SECONDS instead of once.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.monotonic()
+                deleted = cleanup.sweep_verifications(options['batch_size'], options['pause'])
+                keys = cleanup.sweep_idempotency_keys(options['batch_size'], options['pause'])
+                emails = cleanup.sweep_abandoned_emails(options['batch_size'], options['pause'])
+                self.stdout.write(
+                    f"Deleted {deleted} expired verification(s), {keys} idempotency key(s) "
+                    f"and {emails} abandoned outbox email(s) "
+                    f"in {time.monotonic() - started:.2f}s"
+                )
+                if not options['every']:
+                    break
+                time.sleep(options['every'])
+        except KeyboardInterrupt:
+            pass
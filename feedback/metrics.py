@@ -0,0 +1,440 @@
+"""Request, database and email metrics in the Prometheus text format.
+
+MetricsMiddleware times every request and counts its status code, SQL queries
+and SQL time per view name; ``timed()`` measures other operations such as
+sending email. The numbers are kept per process. Every process writes them to
+its own file in METRICS_DIR from time to time and when it exits, and the
+metrics endpoint adds up the files of all processes, so the totals cover
+every gunicorn worker and the send_outbox command.
+
+Each process file is named by an id unique to that process and comes with
+a lock file that the process holds with flock() for as long as it lives.
+Once the lock is free, the process is gone: collect() then folds its file
+into ``totals.json`` and deletes it. This keeps the counters monotonic
+across restarts without letting the directory grow.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+from asgiref.sync import iscoroutinefunction
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help)
+METRICS = {
+    'tratrouble_request_duration_seconds': ('histogram', 'Time to handle a request, per view.'),
+    'tratrouble_requests_total': ('counter', 'Requests per view and status code.'),
+    'tratrouble_db_queries_total': ('counter', 'SQL statements executed while handling requests, per view.'),
+    'tratrouble_db_query_seconds_total': ('counter', 'Time spent executing SQL while handling requests, per view.'),
+    'tratrouble_email_send_seconds': ('histogram', 'Time to hand an email to the SMTP server.'),
+    'tratrouble_outbox_emails_total': ('counter', 'Outbox emails sent, failed for now, or abandoned after the last attempt.'),
+    'tratrouble_token_cache_requests_total': ('counter', 'Token cache lookups.'),
+    'tratrouble_admission_shed_total': ('counter', 'Requests rejected by admission control.'),
+    'tratrouble_write_behind_flushes_total': ('counter', 'Write-behind buffer flushes.'),
+    'tratrouble_write_behind_rows_total': ('counter', 'Feedback rows inserted by the write-behind buffer.'),
+    'tratrouble_log_records_dropped_total': ('counter', 'Log records dropped because the logging queue was full.'),
+    'tratrouble_bad_json_captures_total': ('counter', 'Payloads of bad-json requests written to or dropped from the capture store.'),
+}
+
+_lock = threading.Lock()
+_write_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [count per bucket..., count, sum]
+_last_write = 0.0
+_process = {'pid': None, 'id': None, 'lock_fd': None}
+
+# Counters of processes that are gone, see collect()
+TOTALS_FILE = 'totals.json'
+# Held while folding files into TOTALS_FILE
+FOLD_LOCK_FILE = '.fold.lock'
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[index] += 1
+        histogram[-2] += 1
+        histogram[-1] += value
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the duration of the block in histogram ``name``, with a ``result`` label."""
+    started = time.perf_counter()
+    result = 'error'
+    try:
+        yield
+        result = 'ok'
+    finally:
+        observe(name, time.perf_counter() - started, result=result, **labels)
+        maybe_write()
+
+
+def _component_counters():
+    """Counters that other modules keep for themselves."""
+    from . import admission, captures, token_cache, write_behind
+    from tratroubleBackend.log_handlers import QueueingHandler
+
+    counters = []
+    for result, value in token_cache.stats().items():
+        counters.append(('tratrouble_token_cache_requests_total', {'result': result}, value))
+    for view, reasons in admission.stats().items():
+        for reason, value in reasons.items():
+            counters.append(('tratrouble_admission_shed_total', {'view': view, 'reason': reason}, value))
+    buffer_stats = write_behind.stats()
+    if buffer_stats:
+        counters.append(('tratrouble_write_behind_flushes_total', {'result': 'ok'}, buffer_stats['flushes']))
+        counters.append(('tratrouble_write_behind_flushes_total', {'result': 'error'}, buffer_stats['failed_flushes']))
+        counters.append(('tratrouble_write_behind_rows_total', {}, buffer_stats['rows']))
+    capture_stats = captures.stats()
+    if capture_stats:
+        for result, value in capture_stats.items():
+            counters.append(('tratrouble_bad_json_captures_total', {'result': result}, value))
+    dropped = sum(handler.dropped for handler in logging.getLogger().handlers if isinstance(handler, QueueingHandler))
+    counters.append(('tratrouble_log_records_dropped_total', {}, dropped))
+    return counters
+
+
+def snapshot():
+    """The metrics of this process as a JSON-serializable dict."""
+    with _lock:
+        counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, list(labels), list(values)] for (name, labels), values in _histograms.items()]
+    counters += [[name, sorted(labels.items()), value] for name, labels, value in _component_counters()]
+    return {'pid': os.getpid(), 'counters': counters, 'histograms': histograms}
+
+
+def _process_id():
+    """Id of this process. Unlike the pid, it is not reused by later processes."""
+    if _process['pid'] != os.getpid():
+        # Also after a fork, the child must not share the parent's file
+        _process.update(pid=os.getpid(), id=f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}',
+                        lock_fd=None)
+    return _process['id']
+
+
+def _hold_lock(process_id):
+    """Lock this process's lock file until it exits, telling collect() that it is alive."""
+    if _process['lock_fd'] is None:
+        fd = os.open(os.path.join(settings.METRICS_DIR, process_id + '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        _process['lock_fd'] = fd
+
+
+def write():
+    """Write this process's metrics file."""
+    global _last_write
+    with _write_lock:
+        _last_write = time.monotonic()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        process_id = _process_id()
+        # Locked before the file exists, so that it is never taken for a file of a dead process
+        _hold_lock(process_id)
+        path = os.path.join(settings.METRICS_DIR, process_id + '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+
+def maybe_write():
+    if time.monotonic() - _last_write >= settings.METRICS_WRITE_INTERVAL:
+        try:
+            write()
+        except OSError:
+            logger.warning("Could not write metrics file", exc_info=True)
+
+
+@atexit.register
+def _write_at_exit():
+    if _counters or _histograms:
+        try:
+            write()
+        except Exception:
+            pass
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # Gone, or being replaced right now
+
+
+def _add(counters, histograms, data):
+    for name, labels, value in data['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in data['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        total = histograms.setdefault(key, [0] * len(values))
+        for index, value in enumerate(values):
+            total[index] += value
+
+
+def _is_alive(directory, process_id):
+    try:
+        fd = os.open(os.path.join(directory, process_id + '.lock'), os.O_RDWR)
+    except FileNotFoundError:
+        return False  # Written by a version without lock files
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def _remove(directory, process_id):
+    for suffix in ('.json', '.lock'):
+        try:
+            os.remove(os.path.join(directory, process_id + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def fold_dead_processes(directory=None):
+    """Add the files of processes that are gone to TOTALS_FILE and delete them."""
+    directory = directory or settings.METRICS_DIR
+    fold_fd = os.open(os.path.join(directory, FOLD_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(fold_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # Another process is folding
+        totals_path = os.path.join(directory, TOTALS_FILE)
+        totals = _load(totals_path) or {'counters': [], 'histograms': [], 'folded': []}
+        # Files already added to the totals by a fold that was interrupted before deleting them
+        for process_id in totals['folded']:
+            _remove(directory, process_id)
+
+        counters, histograms = {}, {}
+        _add(counters, histograms, totals)
+        dead = []
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.json') or entry.name == TOTALS_FILE:
+                continue
+            process_id = entry.name[:-len('.json')]
+            if _is_alive(directory, process_id):
+                continue
+            data = _load(entry.path)
+            if data is not None:
+                _add(counters, histograms, data)
+                dead.append(process_id)
+        if not dead and not totals['folded']:
+            return
+
+        totals = {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), values] for (name, labels), values in histograms.items()],
+            'folded': dead,
+        }
+        with open(totals_path + '.tmp', 'w') as f:
+            json.dump(totals, f)
+        os.replace(totals_path + '.tmp', totals_path)
+        for process_id in dead:
+            _remove(directory, process_id)
+    finally:
+        os.close(fold_fd)
+
+
+def collect():
+    """Counters and histograms summed over the metrics files of all processes.
+
+    If METRICS_DIR cannot be written or read, only those of this process.
+    """
+    try:
+        write()
+        fold_dead_processes()
+        return _collect_files()
+    except OSError:
+        logger.warning("Could not use the metrics files in %s, serving the metrics of this process only",
+                       settings.METRICS_DIR, exc_info=True)
+        counters = {}
+        histograms = {}
+        _add(counters, histograms, snapshot())
+        return counters, histograms
+
+
+def _collect_files():
+    counters = {}
+    histograms = {}
+    # Shared, so that no fold moves files into the totals while they are read
+    fold_fd = os.open(os.path.join(settings.METRICS_DIR, FOLD_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fold_fd, fcntl.LOCK_SH)
+        totals = _load(os.path.join(settings.METRICS_DIR, TOTALS_FILE))
+        folded = set(totals['folded']) if totals else set()
+        if totals:
+            _add(counters, histograms, totals)
+        for entry in os.scandir(settings.METRICS_DIR):
+            if not entry.name.endswith('.json') or entry.name == TOTALS_FILE:
+                continue
+            if entry.name[:-len('.json')] in folded:
+                continue  # Already in the totals
+            data = _load(entry.path)
+            if data is not None:
+                _add(counters, histograms, data)
+    finally:
+        os.close(fold_fd)
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            # observe() keeps the bucket counts cumulative already
+            for bound, count in zip(BUCKETS, values):
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {values[-2]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {values[-2]}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryCounter:
+    """Counts the SQL statements of one request and their time, see recording_queries()."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def record(self, sql, seconds, many, alias):
+        self.queries += 1
+        self.seconds += seconds
+
+
+# Recorders of the current request. A ContextVar rather than execute_wrapper()
+# on the request's connections, so that the statements of async views, which
+# run in the threads of sync_to_async with their own connections, are
+# recorded as well.
+_recorders = ContextVar('query_recorders', default=())
+
+
+def _report(execute, sql, params, many, context):
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.record(sql, seconds, many, context['connection'].alias)
+
+
+def _install(connection, **kwargs):
+    if _report not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_report)
+
+
+# Every connection of every thread reports to the recorders of its context
+connection_created.connect(_install)
+
+
+@contextmanager
+def recording_queries(recorder):
+    """Report the SQL statements run in this context, in any thread, to ``recorder.record()``."""
+    # Connections of this thread opened before this module was imported
+    for alias in connections:
+        _install(connections[alias])
+    reset = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(reset)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Answered before URL resolution, e.g. by admission control
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unmatched'
+    return match.view_name or 'unnamed'
+
+
+def _record(request, response, started, queries):
+    view = view_name(request)
+    observe('tratrouble_request_duration_seconds', time.perf_counter() - started, view=view)
+    inc('tratrouble_requests_total', view=view, status=response.status_code)
+    if queries.queries:
+        inc('tratrouble_db_queries_total', queries.queries, view=view)
+        inc('tratrouble_db_query_seconds_total', queries.seconds, view=view)
+    maybe_write()
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            with recording_queries(QueryCounter()) as queries:
+                response = await get_response(request)
+            _record(request, response, started, queries)
+            return response
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            with recording_queries(QueryCounter()) as queries:
+                response = get_response(request)
+            _record(request, response, started, queries)
+            return response
+
+    return middleware
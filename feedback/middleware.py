@@ -0,0 +1,86 @@
+"""Skip the admin-oriented middleware for token-authenticated API requests.
+
+LeanAPIMiddleware stands in for the middleware listed in
+settings.SESSION_MIDDLEWARE. Requests to the LEAN_API_PATHS that carry no
+session cookie, i.e. all requests of the apps, go straight to the next
+middleware. Everything else, the admin and staff users calling the API from
+their browser session, runs through the full list as before.
+"""
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.module_loading import import_string
+from asgiref.sync import iscoroutinefunction
+
+LEAN_ATTRIBUTE = '_lean_middleware'
+
+
+def is_lean(request):
+    return getattr(request, LEAN_ATTRIBUTE, False)
+
+
+def _wants_lean(request):
+    return (
+        request.path_info.startswith(tuple(settings.LEAN_API_PATHS))
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+@sync_and_async_middleware
+def LeanAPIMiddleware(get_response):
+    # All of SESSION_MIDDLEWARE derive from MiddlewareMixin, which adapts
+    # itself to a sync or async get_response, so they can be chained directly.
+    full_stack = get_response
+    instances = []
+    for path in reversed(settings.SESSION_MIDDLEWARE):
+        full_stack = import_string(path)(full_stack)
+        instances.insert(0, full_stack)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            lean = _wants_lean(request)
+            setattr(request, LEAN_ATTRIBUTE, lean)
+            return await (get_response if lean else full_stack)(request)
+    else:
+        def middleware(request):
+            lean = _wants_lean(request)
+            setattr(request, LEAN_ATTRIBUTE, lean)
+            return (get_response if lean else full_stack)(request)
+
+    # The handler only calls the view/exception/template response hooks of
+    # the middleware in settings.MIDDLEWARE, so forward them, in the order
+    # Django would have called them.
+    view_hooks = [m.process_view for m in instances if hasattr(m, 'process_view')]
+    exception_hooks = [m.process_exception for m in reversed(instances) if hasattr(m, 'process_exception')]
+    template_hooks = [
+        m.process_template_response for m in reversed(instances) if hasattr(m, 'process_template_response')
+    ]
+
+    if view_hooks:
+        def process_view(request, view_func, view_args, view_kwargs):
+            if not is_lean(request):
+                for hook in view_hooks:
+                    response = hook(request, view_func, view_args, view_kwargs)
+                    if response is not None:
+                        return response
+            return None
+        middleware.process_view = process_view
+
+    if exception_hooks:
+        def process_exception(request, exception):
+            if not is_lean(request):
+                for hook in exception_hooks:
+                    response = hook(request, exception)
+                    if response is not None:
+                        return response
+            return None
+        middleware.process_exception = process_exception
+
+    if template_hooks:
+        def process_template_response(request, response):
+            if not is_lean(request):
+                for hook in template_hooks:
+                    response = hook(request, response)
+            return response
+        middleware.process_template_response = process_template_response
+
+    return middleware
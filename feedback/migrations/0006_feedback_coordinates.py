@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0005_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedback',
+            name='geo_cell',
+            field=models.CharField(blank=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['geo_cell', 'timestamp'], name='feedback_fe_geo_cel_be3622_idx'),
+        ),
+    ]
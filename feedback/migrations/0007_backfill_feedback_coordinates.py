@@ -0,0 +1,36 @@
+from django.db import migrations
+
+from feedback import geo
+
+BATCH_SIZE = 2000
+
+
+def backfill_coordinates(apps, schema_editor):
+    Feedback = apps.get_model('feedback', 'Feedback')
+    last_id = 0
+    while True:
+        # Keyset pagination on id; each chunk is committed on its own
+        chunk = list(
+            Feedback.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'geo_location')[:BATCH_SIZE]
+        )
+        if not chunk:
+            break
+        for row in chunk:
+            row.latitude, row.longitude, row.geo_cell = geo.locate(row.geo_location)
+        Feedback.objects.bulk_update(chunk, ['latitude', 'longitude', 'geo_cell'])
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+    # Don't hold a write lock on the whole table for the entire backfill
+    atomic = False
+
+    dependencies = [
+        ('feedback', '0006_feedback_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_coordinates, migrations.RunPython.noop),
+    ]
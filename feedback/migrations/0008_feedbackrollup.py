@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:40
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import F
+
+BATCH_SIZE = 2000
+
+
+def backfill_rollups(apps, schema_editor):
+    """Count the feedback submitted before the rollups were kept up to date."""
+    Feedback = apps.get_model('feedback', 'Feedback')
+    FeedbackRollup = apps.get_model('feedback', 'FeedbackRollup')
+    last_id = 0
+    while True:
+        # Keyset pagination on id, so memory use does not depend on the table size
+        chunk = list(
+            Feedback.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'line', 'destination', 'timestamp')[:BATCH_SIZE]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        counts = Counter(
+            (line, destination, timestamp.replace(minute=0, second=0, microsecond=0))
+            for _, line, destination, timestamp in chunk
+        )
+        for (line, destination, hour), count in counts.items():
+            bucket = FeedbackRollup.objects.filter(line=line, destination=destination, hour=hour)
+            if not bucket.update(count=F('count') + count):
+                FeedbackRollup.objects.create(line=line, destination=destination, hour=hour, count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0007_backfill_feedback_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedbackRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line', models.CharField(max_length=100)),
+                ('destination', models.CharField(max_length=100)),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='feedback_fe_hour_9d3527_idx')],
+                'constraints': [models.UniqueConstraint(fields=('line', 'destination', 'hour'), name='feedback_rollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0009_emailverification_expiry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revoked_at', models.DateTimeField(auto_now_add=True)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('verification', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='revocation', to='feedback.emailverification')),
+            ],
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def _intern(model, ids, names):
+    """Add the ids of ``names`` to the ``ids`` dict, creating missing rows."""
+    missing = names - ids.keys()
+    if missing:
+        model.objects.bulk_create([model(name=name) for name in missing], ignore_conflicts=True)
+        ids.update(model.objects.filter(name__in=missing).values_list('name', 'id'))
+
+
+def backfill_references(apps, schema_editor):
+    Feedback = apps.get_model('feedback', 'Feedback')
+    EmailVerification = apps.get_model('feedback', 'EmailVerification')
+    Line = apps.get_model('feedback', 'Line')
+    Destination = apps.get_model('feedback', 'Destination')
+    lines = {}
+    destinations = {}
+    last_id = 0
+    while True:
+        # Keyset pagination on id; each chunk is committed on its own
+        chunk = list(
+            Feedback.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'token', 'line', 'destination')[:BATCH_SIZE]
+        )
+        if not chunk:
+            break
+        _intern(Line, lines, {row.line for row in chunk})
+        _intern(Destination, destinations, {row.destination for row in chunk})
+        verifications = dict(
+            EmailVerification.objects.filter(token__in={row.token for row in chunk}).values_list('token', 'id')
+        )
+        for row in chunk:
+            # Feedback of a verification that was deleted keeps no reference
+            row.verification_id = verifications.get(row.token)
+            row.line_ref_id = lines[row.line]
+            row.destination_ref_id = destinations[row.destination]
+        Feedback.objects.bulk_update(chunk, ['verification', 'line_ref', 'destination_ref'])
+        last_id = chunk[-1].id
+
+
+def restore_strings(apps, schema_editor):
+    Feedback = apps.get_model('feedback', 'Feedback')
+    last_id = 0
+    while True:
+        chunk = list(
+            Feedback.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .select_related('verification', 'line_ref', 'destination_ref')[:BATCH_SIZE]
+        )
+        if not chunk:
+            break
+        for row in chunk:
+            row.token = row.verification.token if row.verification else ''
+            row.line = row.line_ref.name
+            row.destination = row.destination_ref.name
+        Feedback.objects.bulk_update(chunk, ['token', 'line', 'destination'])
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+    # Don't hold a write lock on the whole table for the entire backfill
+    atomic = False
+
+    dependencies = [
+        ('feedback', '0011_feedback_references'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_references, restore_strings),
+    ]
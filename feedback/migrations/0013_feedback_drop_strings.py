@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0012_backfill_feedback_references'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='feedback',
+            name='token',
+        ),
+        migrations.RemoveField(
+            model_name='feedback',
+            name='line',
+        ),
+        migrations.RemoveField(
+            model_name='feedback',
+            name='destination',
+        ),
+        migrations.RenameField(
+            model_name='feedback',
+            old_name='line_ref',
+            new_name='line',
+        ),
+        migrations.RenameField(
+            model_name='feedback',
+            old_name='destination_ref',
+            new_name='destination',
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='line',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='feedback', to='feedback.line'),
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='destination',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='feedback', to='feedback.destination'),
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def dedupe_pending(apps, schema_editor):
+    """Keep only the newest pending verification per email and device."""
+    EmailVerification = apps.get_model('feedback', 'EmailVerification')
+    pending = EmailVerification.objects.filter(verified=False)
+    duplicates = (
+        pending.values('email', 'device_id')
+        .annotate(count=Count('id'), newest=Max('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for group in duplicates.iterator():
+        pending.filter(email=group['email'], device_id=group['device_id'], id__lt=group['newest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0014_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_pending, migrations.RunPython.noop),
+    ]
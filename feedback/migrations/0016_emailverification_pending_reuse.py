@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0015_dedupe_pending_verifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailverification',
+            name='last_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='emailverification',
+            index=models.Index(fields=['email', 'device_id', 'verified', 'expires_at'], name='feedback_em_email_6c77a5_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='emailverification',
+            constraint=models.UniqueConstraint(condition=models.Q(('verified', False)), fields=('email', 'device_id'), name='one_pending_verification'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0016_emailverification_pending_reuse'),
+    ]
+
+    # The new indexes are created before the ones they replace are dropped
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['timestamp', 'id'], name='feedback_fe_timesta_802398_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['line', 'timestamp', 'id'], name='feedback_fe_line_id_87058f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['destination', 'timestamp', 'id'], name='feedback_fe_destina_ced3b3_idx'),
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='destination',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='feedback', to='feedback.destination'),
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='line',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='feedback', to='feedback.line'),
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0017_feedback_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailverification',
+            index=models.Index(fields=['created_at', 'id'], name='feedback_em_created_a07437_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0018_emailverification_created_index'),
+    ]
+
+    # The new indexes are created before the ones they replace are dropped
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['line', 'id'], name='feedback_fe_line_id_9c3e1d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['destination', 'id'], name='feedback_fe_destina_0d76eb_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='feedback',
+            name='feedback_fe_line_id_87058f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='feedback',
+            name='feedback_fe_destina_ced3b3_idx',
+        ),
+    ]
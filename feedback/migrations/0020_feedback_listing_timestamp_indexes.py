@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0019_feedback_listing_id_indexes'),
+    ]
+
+    # Back to the indexes of 0017 for the (timestamp, id) keyset pagination;
+    # the new indexes are created before the ones they replace are dropped
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['line', 'timestamp', 'id'], name='feedback_fe_line_id_87058f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['destination', 'timestamp', 'id'], name='feedback_fe_destina_ced3b3_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='feedback',
+            name='feedback_fe_line_id_9c3e1d_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='feedback',
+            name='feedback_fe_destina_0d76eb_idx',
+        ),
+    ]
@@ -1,15 +1,98 @@
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 
+from . import geo
+
+class FeedbackQuerySet(models.QuerySet):
+    def in_bbox(self, south, west, north, east):
+        """Feedback located inside the bounding box, found via the geo_cell index."""
+        cells = Q()
+        for start, end in geo.cell_ranges(geo.covering_cells(south, west, north, east)):
+            cells |= Q(geo_cell__gte=start, geo_cell__lt=end)
+        return self.filter(
+            cells,
+            latitude__range=(south, north),
+            longitude__range=(west, east),
+        )
+
+    def near(self, latitude, longitude, radius_m):
+        """Feedback within the square of +/- ``radius_m`` around a point, e.g. a stop."""
+        return self.in_bbox(*geo.bounding_box(latitude, longitude, radius_m))
+
+    def between(self, start=None, end=None):
+        """Feedback submitted in ``[start, end)``; either bound may be omitted."""
+        qs = self
+        if start is not None:
+            qs = qs.filter(timestamp__gte=start)
+        if end is not None:
+            qs = qs.filter(timestamp__lt=end)
+        return qs
+
+class Line(models.Model):
+    """A distinct line name; Feedback refers to it instead of repeating the string."""
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+class Destination(models.Model):
+    """A distinct destination name, interned like Line."""
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
 class Feedback(models.Model):
-    token = models.CharField(max_length=64)
+    # Null for feedback whose verification no longer exists
+    verification = models.ForeignKey(
+        'EmailVerification', null=True, blank=True, on_delete=models.SET_NULL, related_name='feedback',
+    )
+    # Indexed together with id, line and destination below
     timestamp = models.DateTimeField(auto_now_add=True)
+    line = models.ForeignKey(Line, on_delete=models.PROTECT, related_name='feedback', db_index=False)
+    destination = models.ForeignKey(Destination, on_delete=models.PROTECT, related_name='feedback', db_index=False)
+    geo_location = models.CharField(max_length=100)  # Raw value as submitted by the app
+    # Parsed from geo_location on ingestion; null if it could not be parsed
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geo_cell = models.CharField(max_length=12, blank=True, default='')  # Geohash of latitude/longitude
+
+    objects = FeedbackQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['geo_cell', 'timestamp']),
+            # Keyset pagination of feedback.listing, optionally by line or destination
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['line', 'timestamp', 'id']),
+            models.Index(fields=['destination', 'timestamp', 'id']),
+        ]
+
+    def __str__(self):
+        return f"Feedback {self.id} for line {self.line} to {self.destination}"
+
+class FeedbackRollup(models.Model):
+    """Number of Feedback rows per line, destination and hour (UTC).
+
+    Kept up to date by feedback.rollups on every insert; rebuild it from scratch
+    with the ``rebuild_rollups`` management command.
+    """
     line = models.CharField(max_length=100)
     destination = models.CharField(max_length=100)
-    geo_location = models.CharField(max_length=100)  # Could be changed to a more appropriate field type
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['line', 'destination', 'hour'], name='feedback_rollup_key'),
+        ]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
 
     def __str__(self):
-        return f"Feedback {self.id} for line {self.line} to {self.destination}"
+        return f"{self.count} x line {self.line} to {self.destination} at {self.hour}"
 
 class EmailVerification(models.Model):
     email = models.EmailField()
@@ -19,14 +102,75 @@ class EmailVerification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(default=timezone.now)
     verified = models.BooleanField(default=False)
+    last_sent_at = models.DateTimeField(null=True, blank=True)  # When the verification email last went out
 
     class Meta:
+        constraints = [
+            # Repeated submissions reuse the pending verification, see feedback.verifications
+            models.UniqueConstraint(
+                fields=['email', 'device_id'], condition=Q(verified=False), name='one_pending_verification',
+            ),
+        ]
         indexes = [
             models.Index(fields=['token']),
             models.Index(fields=['email']),
             models.Index(fields=['email', 'verified']),
+            # Used by the sweep_expired command
+            models.Index(fields=['verified', 'expires_at']),
+            models.Index(fields=['email', 'device_id', 'verified', 'expires_at']),
+            # Ordering and date_hierarchy of the admin changelist
+            models.Index(fields=['created_at', 'id']),
         ]
 
     def __str__(self):
         status = "verified" if self.verified else "pending"
         return f"{self.email} ({self.platform}) - {status}"
+
+class RevokedAccess(models.Model):
+    """A verification whose tokens, including signed access tokens, are no longer accepted."""
+    verification = models.OneToOneField(EmailVerification, on_delete=models.CASCADE, related_name='revocation')
+    revoked_at = models.DateTimeField(auto_now_add=True)
+    reason = models.CharField(max_length=200, blank=True)
+
+    def __str__(self):
+        return f"Access of {self.verification.email} revoked at {self.revoked_at}"
+
+class IdempotencyKey(models.Model):
+    """A POST request sent with an Idempotency-Key header, and its response once it completed."""
+    key = models.CharField(max_length=64, unique=True)  # Hash of the header, path and device id
+    fingerprint = models.CharField(max_length=64)  # Hash of the request body
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    completed = models.BooleanField(default=False)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.BinaryField(blank=True, default=b'')
+
+    class Meta:
+        indexes = [
+            # Used by the sweep_expired command
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        state = f"status {self.status_code}" if self.completed else "in progress"
+        return f"Idempotency key {self.key[:12]} ({state})"
+
+class OutboxEmail(models.Model):
+    """Email waiting to be delivered by the ``send_outbox`` management command."""
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipient = models.EmailField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"Email to {self.recipient} ({self.attempts} attempts)"
@@ -0,0 +1,120 @@
+"""Durable outbox for outgoing email.
+
+Views call ``enqueue()`` inside their transaction and return as soon as the row
+is committed. The ``send_outbox`` management command delivers the queued
+messages over a single SMTP connection and retries failures with exponential
+backoff.
+
+Before sending a message, the sender claims it with a conditional UPDATE that
+counts the attempt and moves ``next_attempt_at`` to the time of the retry, so
+that several senders never deliver the same message twice, and a sender that
+dies mid-send leaves the message due again later. Messages that used up
+EMAIL_OUTBOX_MAX_ATTEMPTS are abandoned: logged, counted in the
+``tratrouble_outbox_emails_total`` metric and, after
+EMAIL_OUTBOX_ABANDONED_RETENTION seconds, deleted by the ``sweep_expired``
+command.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(subject, body, recipient, from_email=None):
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipient=recipient,
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after ``attempts`` failures."""
+    delay = settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 ** max(attempts - 1, 0)
+    return min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_SECONDS)
+
+
+def due_messages(batch_size=None):
+    return (
+        OutboxEmail.objects
+        .filter(next_attempt_at__lte=timezone.now(), attempts__lt=settings.EMAIL_OUTBOX_MAX_ATTEMPTS)
+        .order_by('next_attempt_at', 'id')[:batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE]
+    )
+
+
+def abandoned():
+    """Messages that used up EMAIL_OUTBOX_MAX_ATTEMPTS; ``next_attempt_at`` is when they were given up."""
+    return OutboxEmail.objects.filter(attempts__gte=settings.EMAIL_OUTBOX_MAX_ATTEMPTS)
+
+
+def claim(item):
+    """Count an attempt at ``item`` unless another sender claimed it first. Returns whether it did."""
+    attempts = item.attempts + 1
+    now = timezone.now()
+    if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        next_attempt_at = now
+    else:
+        next_attempt_at = now + timedelta(seconds=retry_delay(attempts))
+    claimed = OutboxEmail.objects.filter(
+        id=item.id, attempts=item.attempts, next_attempt_at=item.next_attempt_at,
+    ).update(attempts=F('attempts') + 1, next_attempt_at=next_attempt_at)
+    item.attempts, item.next_attempt_at = attempts, next_attempt_at
+    return bool(claimed)
+
+
+def send_pending(connection=None, batch_size=None):
+    """Deliver one batch of due messages. Returns ``(sent, failed)``.
+
+    All messages of the batch go over ``connection``, which is opened if needed
+    and left open so that the caller can reuse it for the next batch.
+    """
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+    for item in list(due_messages(batch_size)):
+        if not claim(item):
+            continue  # Taken by another sender
+        message = EmailMessage(
+            item.subject, item.body, item.from_email, [item.recipient], connection=connection,
+        )
+        try:
+            # A no-op while the connection is up; send_messages() would close
+            # a connection it opened itself after every single message.
+            with metrics.timed('tratrouble_email_send_seconds', via='outbox'):
+                connection.open()
+                connection.send_messages([message])
+        except Exception as exc:
+            failed += 1
+            # claim() has already counted the attempt and scheduled the retry
+            item.last_error = f"{type(exc).__name__}: {exc}"
+            item.save(update_fields=['last_error'])
+            if item.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                metrics.inc('tratrouble_outbox_emails_total', result='abandoned')
+                logger.error("Giving up outbox email %s to %s after %s attempts: %s",
+                             item.id, item.recipient, item.attempts, exc)
+            else:
+                metrics.inc('tratrouble_outbox_emails_total', result='failed')
+                logger.warning("Sending outbox email %s failed (attempt %s): %s", item.id, item.attempts, exc)
+            # The connection may be broken; start over with a fresh one
+            close_quietly(connection)
+        else:
+            sent += 1
+            metrics.inc('tratrouble_outbox_emails_total', result='sent')
+            item.delete()
+    metrics.maybe_write()
+    return sent, failed
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        logger.debug("Error while closing SMTP connection", exc_info=True)
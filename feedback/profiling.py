@@ -0,0 +1,258 @@
+"""On-demand profiles of single requests, for finding out why an endpoint got slow.
+
+ProfilingMiddleware profiles a request if it carries an X-Tratrouble-Profile
+header with the value of ``header_value()`` (printed by ``python manage.py
+profiles --header``), or, while a staff user has switched sampling on via
+ProfilingView, with the chosen probability. Other requests only pay for a
+random number and, every PROFILING_SWITCH_CHECK_INTERVAL seconds, a cache
+lookup of the switch.
+
+Every profile is a pair of files in PROFILING_DIR, named by its id: the
+cProfile stats in ``<id>.prof``, readable with pstats, and ``<id>.json`` with
+the view, status, duration and the SQL statements of the request with their
+timings. Only the newest PROFILING_MAX_PROFILES are kept. Under ASGI only the
+SQL statements are recorded, including those of the sync_to_async threads of
+the async views, since a profile of the event loop would mix the request up
+with all others in flight.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+from asgiref.sync import iscoroutinefunction
+
+from .metrics import recording_queries, view_name
+
+HEADER = 'HTTP_X_TRATROUBLE_PROFILE'
+# Tells the client which profile its request produced
+RESPONSE_HEADER = 'X-Tratrouble-Profile-Id'
+SALT = 'tratrouble.profiling'
+SWITCH_KEY = 'profiling:switch'
+
+_switch = {'sample_rate': 0.0, 'until': 0.0, 'checked': 0.0}
+
+
+def _signer():
+    return signing.TimestampSigner(salt=SALT)
+
+
+def header_value():
+    """Value of the X-Tratrouble-Profile header; valid for PROFILING_HEADER_MAX_AGE seconds."""
+    return _signer().sign('profile')
+
+
+def _valid_header(value):
+    try:
+        return _signer().unsign(value, max_age=settings.PROFILING_HEADER_MAX_AGE) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+def switch_sampling(sample_rate, seconds):
+    """Profile ``sample_rate`` (0 to 1) of all requests of all processes for the next ``seconds``."""
+    state = {'sample_rate': sample_rate, 'until': time.time() + seconds}
+    cache.set(SWITCH_KEY, state, seconds)
+    _switch.update(state, checked=time.time())
+    return state
+
+
+def _sampling_state(now):
+    if _switch['until'] <= now:
+        return {'sample_rate': 0.0, 'until': None}
+    return {'sample_rate': _switch['sample_rate'], 'until': _switch['until']}
+
+
+def sampling():
+    """The ``{'sample_rate', 'until'}`` of the sampling switch as last read from the cache."""
+    now = time.time()
+    if now - _switch['checked'] >= settings.PROFILING_SWITCH_CHECK_INTERVAL:
+        _switch.update(cache.get(SWITCH_KEY) or {'sample_rate': 0.0, 'until': 0.0}, checked=now)
+    return _sampling_state(now)
+
+
+async def asampling():
+    now = time.time()
+    if now - _switch['checked'] >= settings.PROFILING_SWITCH_CHECK_INTERVAL:
+        _switch.update(await cache.aget(SWITCH_KEY) or {'sample_rate': 0.0, 'until': 0.0}, checked=now)
+    return _sampling_state(now)
+
+
+def _header_trigger(request):
+    value = request.META.get(HEADER)
+    return 'header' if value and _valid_header(value) else None
+
+
+def _trigger(request):
+    """Why ``request`` should be profiled, or None."""
+    if _header_trigger(request):
+        return 'header'
+    if random.random() < sampling()['sample_rate']:
+        return 'sample'
+    return None
+
+
+async def _atrigger(request):
+    if _header_trigger(request):
+        return 'header'
+    if random.random() < (await asampling())['sample_rate']:
+        return 'sample'
+    return None
+
+
+class QueryRecorder:
+    """Records the SQL statements of one request and their time, see metrics.recording_queries()."""
+
+    def __init__(self):
+        self.statements = []
+        self.queries = 0
+        self.seconds = 0.0
+
+    def record(self, sql, seconds, many, alias):
+        self.queries += 1
+        self.seconds += seconds
+        # Without the parameters, which may contain tokens and email addresses
+        if len(self.statements) < settings.PROFILING_MAX_QUERIES:
+            self.statements.append({'sql': sql, 'seconds': seconds, 'many': many, 'database': alias})
+
+
+def _start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows only one active profiler per process
+        return None
+    return profiler
+
+
+def save(request, response, trigger, duration, profiler, queries, directory=None):
+    """Write the profile of ``request`` and drop the oldest ones. Returns its id."""
+    directory = directory or settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f'{time.time_ns()}-{os.getpid()}'
+    base = os.path.join(directory, profile_id)
+    if profiler is not None:
+        profiler.dump_stats(base + '.prof')
+    record = {
+        'id': profile_id,
+        'time': timezone.now().isoformat(),
+        'view': view_name(request),
+        'method': request.method,
+        'path': request.path,  # Without the query string, which may contain a token
+        'status': response.status_code,
+        'trigger': trigger,
+        'duration': duration,
+        'profiled': profiler is not None,
+        'queries': queries.queries,
+        'query_seconds': queries.seconds,
+        'statements': queries.statements,
+    }
+    # The .json file appears last and complete, readers go by it
+    with open(base + '.json.tmp', 'w') as f:
+        json.dump(record, f)
+    os.replace(base + '.json.tmp', base + '.json')
+    enforce_limit(directory)
+    return profile_id
+
+
+def profile_ids(directory=None):
+    """Ids of the stored profiles, oldest first."""
+    directory = directory or settings.PROFILING_DIR
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted((name[:-len('.json')] for name in names if name.endswith('.json')),
+                  key=lambda profile_id: int(profile_id.split('-')[0]))
+
+
+def enforce_limit(directory=None, max_profiles=None):
+    directory = directory or settings.PROFILING_DIR
+    max_profiles = settings.PROFILING_MAX_PROFILES if max_profiles is None else max_profiles
+    ids = profile_ids(directory)
+    for profile_id in ids[:max(0, len(ids) - max_profiles)]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def load(directory=None):
+    """The records of all stored profiles, oldest first."""
+    directory = directory or settings.PROFILING_DIR
+    records = []
+    for profile_id in profile_ids(directory):
+        try:
+            with open(os.path.join(directory, profile_id + '.json')) as f:
+                records.append(json.load(f))
+        except (FileNotFoundError, ValueError):
+            continue  # Deleted meanwhile by another process
+    return records
+
+
+def function_stats(records, directory=None):
+    """pstats.Stats of the cProfile stats of ``records`` added up, or None if none has any."""
+    directory = directory or settings.PROFILING_DIR
+    stats = None
+    for record in records:
+        path = os.path.join(directory, record['id'] + '.prof')
+        if not record.get('profiled') or not os.path.exists(path):
+            continue
+        if stats is None:
+            stats = pstats.Stats(path)
+        else:
+            stats.add(path)
+    return stats
+
+
+def top_statements(records, limit):
+    """The ``limit`` SQL statements of ``records`` with the most total time, as (sql, count, seconds)."""
+    totals = defaultdict(lambda: [0, 0.0])
+    for record in records:
+        for statement in record['statements']:
+            total = totals[statement['sql']]
+            total[0] += 1
+            total[1] += statement['seconds']
+    ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+    return [(sql, count, seconds) for sql, (count, seconds) in ranked[:limit]]
+
+
+@sync_and_async_middleware
+def ProfilingMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            trigger = await _atrigger(request)
+            if trigger is None:
+                return await get_response(request)
+            started = time.perf_counter()
+            with recording_queries(QueryRecorder()) as queries:
+                response = await get_response(request)
+            response[RESPONSE_HEADER] = save(request, response, trigger, time.perf_counter() - started, None, queries)
+            return response
+    else:
+        def middleware(request):
+            trigger = _trigger(request)
+            if trigger is None:
+                return get_response(request)
+            started = time.perf_counter()
+            with recording_queries(QueryRecorder()) as queries:
+                profiler = _start_profiler()
+                try:
+                    response = get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+            response[RESPONSE_HEADER] = save(request, response, trigger, time.perf_counter() - started, profiler, queries)
+            return response
+
+    return middleware
@@ -0,0 +1,83 @@
+"""Routing the token lookups to read replicas.
+
+Writes and most reads go to the primary ('default'). Only the reads inside a
+``replica_reads()`` block go to one of settings.DATABASE_REPLICAS: the token
+lookups of feedback.token_cache, behind IsValidTokenPermission and
+CheckTokenView, which make up most of the traffic and can stand a replica
+that is a moment behind.
+
+Except right after a token was verified: the app asks check-token at once,
+and a lagging replica would still call the token unverified. VerifyEmailView
+therefore calls ``stick()``, and for DATABASE_STICKY_SECONDS the lookups of
+that token read from the primary again. The marks are kept in the Django
+cache, so replicas require a shared cache backend, which the system check
+in feedback.checks enforces.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+KEY_PREFIX = 'feedback:sticky:'
+
+# Set by replica_reads(); a ContextVar so that it follows async views into
+# the threads of sync_to_async
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def _key(token):
+    # Tokens are up to 64 characters, which some cache backends do not accept in keys
+    return KEY_PREFIX + hashlib.sha256(token.encode()).hexdigest()
+
+
+def stick(token):
+    """Read ``token`` from the primary for the next DATABASE_STICKY_SECONDS."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(_key(token), True, settings.DATABASE_STICKY_SECONDS)
+
+
+def is_sticky(token):
+    return bool(settings.DATABASE_REPLICAS) and cache.get(_key(token), False)
+
+
+async def ais_sticky(token):
+    return bool(settings.DATABASE_REPLICAS) and await cache.aget(_key(token), False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Send the reads inside the block to a replica, if ``enabled`` and there is one."""
+    if not enabled or not settings.DATABASE_REPLICAS:
+        yield
+        return
+    reset = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(reset)
+
+
+class ReplicaRouter:
+    """Database router for settings.DATABASE_ROUTERS, installed when there are replicas."""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        # Explicit, so that related objects of rows read from a replica are
+        # not read from it as well
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, so that rows read from a replica are saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,82 @@
+"""Incrementally maintained per-line/per-destination feedback counts.
+
+``record()`` is called in the same transaction that inserts Feedback rows, so
+FeedbackRollup always matches the Feedback table and "which lines get the most
+complaints" never needs a GROUP BY over all feedback.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+
+from .models import Destination, Feedback, FeedbackRollup, Line
+
+
+def hour_bucket(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _increment(line, destination, hour, count):
+    return FeedbackRollup.objects.filter(
+        line=line, destination=destination, hour=hour,
+    ).update(count=F('count') + count)
+
+
+def record(rows):
+    """Add freshly inserted Feedback ``rows`` to the rollups."""
+    # ingestion.build_feedback() attaches the Line and Destination rows, so this
+    # does not query them
+    counts = Counter((row.line.name, row.destination.name, hour_bucket(row.timestamp)) for row in rows)
+    for (line, destination, hour), count in counts.items():
+        if _increment(line, destination, hour, count):
+            continue
+        try:
+            with transaction.atomic():
+                FeedbackRollup.objects.create(line=line, destination=destination, hour=hour, count=count)
+        except IntegrityError:
+            # Another worker created the bucket in the meantime
+            _increment(line, destination, hour, count)
+
+
+def rebuild(batch_size=1000):
+    """Recompute all rollups from the Feedback table. Returns the number of buckets."""
+    buckets = (
+        Feedback.objects
+        .annotate(hour=TruncHour('timestamp'))
+        .values_list('line_id', 'destination_id', 'hour')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    # Group on the ids and look the names up once rather than joining every row
+    lines = dict(Line.objects.values_list('id', 'name'))
+    destinations = dict(Destination.objects.values_list('id', 'name'))
+    total = 0
+    with transaction.atomic():
+        FeedbackRollup.objects.all().delete()
+        batch = []
+        for line_id, destination_id, hour, count in buckets.iterator(chunk_size=batch_size):
+            batch.append(FeedbackRollup(
+                line=lines[line_id], destination=destinations[destination_id], hour=hour, count=count,
+            ))
+            if len(batch) >= batch_size:
+                FeedbackRollup.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        FeedbackRollup.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def top_lines(start=None, end=None, limit=10):
+    """Lines with the most feedback in ``[start, end)``, rounded to whole hours."""
+    qs = FeedbackRollup.objects.all()
+    if start is not None:
+        qs = qs.filter(hour__gte=hour_bucket(start))
+    if end is not None:
+        qs = qs.filter(hour__lt=hour_bucket(end))
+    return list(
+        qs.values('line')
+        .annotate(count=Sum('count'))
+        .order_by('-count', 'line')[:limit]
+    )
@@ -0,0 +1,597 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.db import IntegrityError, connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    access_tokens, admission, checks, cleanup, idempotency, ingestion, interning, metrics, outbox, replicas,
+    rollups, token_cache,
+    write_behind,
+)
+from .models import EmailVerification, Feedback, FeedbackRollup, OutboxEmail
+
+
+class VerifiedTokenTestCase(TestCase):
+    """Has the verified token ``self.token``, starting without cached lookups and revocations."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.token = 'a' * 64
+        cls.verification = EmailVerification.objects.create(
+            email='user@example.com', token=cls.token, device_id='device', verified=True,
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+    def setUp(self):
+        # Rolled-back rows must not live on in the per-process caches
+        cache.clear()
+        access_tokens.reload_revocations()
+        self.addCleanup(access_tokens.reload_revocations)
+
+
+class AdminChangelistQueriesTest(TestCase):
+    """The changelists of the large tables run a fixed number of queries, see feedback.admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        for n in range(30):
+            ev = EmailVerification.objects.create(
+                email=f'user{n}@example.com', token=f'{n:064x}', device_id='device', expires_at=timezone.now(),
+            )
+            Feedback.objects.create(
+                verification=ev, line=interning.line(f'Line {n % 3}'),
+                destination=interning.destination('Station'), geo_location='35.68,139.76',
+            )
+
+    def setUp(self):
+        self.client.login(username='admin', password='password')
+
+    def assertPageBounded(self, queries, table, ordering):
+        """The page of the changelist is a LIMITed read along the index of ``ordering``."""
+        order_by = ', '.join(f'"{table}"."{column}" DESC' for column in ordering)
+        pages = [query['sql'] for query in queries if f'ORDER BY {order_by}' in query['sql']]
+        self.assertEqual(len(pages), 1)
+        self.assertTrue(pages[0].endswith('LIMIT 50'), pages[0])
+
+    def test_feedback_changelist(self):
+        # Session, user, estimated count, page, date_hierarchy range and choices
+        with self.assertNumQueries(6) as queries:
+            response = self.client.get('/admin/feedback/feedback/')
+        self.assertEqual(response.status_code, 200)
+        self.assertPageBounded(queries, 'feedback_feedback', ('timestamp', 'id'))
+
+    def test_emailverification_changelist(self):
+        with self.assertNumQueries(6) as queries:
+            response = self.client.get('/admin/feedback/emailverification/')
+        self.assertEqual(response.status_code, 200)
+        self.assertPageBounded(queries, 'feedback_emailverification', ('created_at', 'id'))
+        self.assertEqual(len(response.context['cl'].result_list), 30)
+
+    def test_estimate_too_low(self):
+        # E.g. statistics from before the rows were inserted
+        with mock.patch('feedback.admin.estimated_rows', return_value=0), self.assertNumQueries(5) as queries:
+            response = self.client.get('/admin/feedback/emailverification/')
+        self.assertEqual(response.status_code, 200)
+        self.assertPageBounded(queries, 'feedback_emailverification', ('created_at', 'id'))
+
+
+class NonStringGeoLocationTest(VerifiedTokenTestCase):
+    """Numbers and lists as geo_location are stored as text, as they always were."""
+
+    def test_submit_feedback(self):
+        for geo_location in (52.5, [52.5, 13.4]):
+            response = self.client.post('/api/submit-feedback/', {
+                'token': self.token, 'line': 'Line', 'destination': 'Station', 'geo_location': geo_location,
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Feedback.objects.order_by('id').values_list('geo_location', flat=True)),
+                         ['52.5', '[52.5, 13.4]'])
+
+    def test_submit_feedback_batch(self):
+        items = [{'line': 'Line', 'destination': 'Station', 'geo_location': geo_location}
+                 for geo_location in (52.5, [52.5, 13.4], '52.5,13.4')]
+        response = self.client.post('/api/submit-feedback-batch/', {'token': self.token, 'items': items},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['created'] * 3)
+        row = Feedback.objects.get(geo_location='[52.5, 13.4]')
+        self.assertEqual((row.latitude, row.longitude), (52.5, 13.4))
+
+
+class FeedbackListTest(TestCase):
+    """Keyset pages of /api/feedback/, see feedback.listing."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        rows = [Feedback.objects.create(line=interning.line('Line'), destination=interning.destination('Station'),
+                                        geo_location='35.68,139.76') for _ in range(5)]
+        # All but the newest row are settled; two share a timestamp
+        settled = timezone.now() - timedelta(minutes=1)
+        for offset, row in zip((0, 1, 1, 2), rows[:4]):
+            Feedback.objects.filter(id=row.id).update(timestamp=settled - timedelta(seconds=offset))
+        cls.ids = [row.id for row in rows]
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_pages(self):
+        response = self.client.get('/api/feedback/', {'limit': 2})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.ids[0], self.ids[2]])
+        self.assertIn('Last-Modified', response)
+        response = self.client.get('/api/feedback/', {'limit': 2, 'cursor': response.json()['next_cursor']})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.ids[1], self.ids[3]])
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_not_modified(self):
+        response = self.client.get('/api/feedback/', {'line': 'Line'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/feedback/', {'line': 'Line'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class SubmitEmailTest(TestCase):
+    """Pending verifications are reused and their emails throttled, see feedback.verifications."""
+
+    def submit(self, email='user@example.com', device_id='device'):
+        return self.client.post('/api/submit-email/', {'email': email}, HTTP_X_DEVICE_ID=device_id)
+
+    @override_settings(EMAIL_VERIFICATION_RESEND_INTERVAL=0)
+    def test_reuses_pending_verification(self):
+        self.assertEqual(self.submit().status_code, 200)
+        self.assertEqual(self.submit().status_code, 200)
+        ev = EmailVerification.objects.get()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertTrue(all(ev.token in message.body for message in mail.outbox))
+        # Another device gets its own verification
+        self.assertEqual(self.submit(device_id='other').status_code, 200)
+        self.assertEqual(EmailVerification.objects.count(), 2)
+
+    def test_one_pending_verification_constraint(self):
+        self.submit()
+        ev = EmailVerification.objects.get()
+        with self.assertRaises(IntegrityError):
+            EmailVerification.objects.create(
+                email=ev.email, token='b' * 64, device_id=ev.device_id, expires_at=ev.expires_at,
+            )
+
+    @override_settings(EMAIL_VERIFICATION_RESEND_INTERVAL=60)
+    def test_resend_throttled(self):
+        self.assertEqual(self.submit().status_code, 200)
+        response = self.submit()
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_expired_verification_replaced(self):
+        self.submit()
+        old = EmailVerification.objects.get()
+        EmailVerification.objects.filter(pk=old.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.submit().status_code, 200)
+        ev = EmailVerification.objects.get()
+        self.assertEqual(ev.pk, old.pk)
+        self.assertNotEqual(ev.token, old.token)
+        self.assertGreater(ev.expires_at, timezone.now())
+        self.assertIn(ev.token, mail.outbox[-1].body)
+
+
+class DedupePendingVerificationsMigrationTest(TransactionTestCase):
+    """Migration 0015 leaves one pending verification per email and device for the constraint of 0016."""
+    before = [('feedback', '0014_idempotencykey')]
+    after = [('feedback', '0015_dedupe_pending_verifications')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_dedupe(self):
+        apps = self.migrate(self.before)
+        Verification = apps.get_model('feedback', 'EmailVerification')
+        expires_at = timezone.now() + timedelta(days=1)
+        for n, (email, verified) in enumerate([('a@example.com', False), ('a@example.com', False),
+                                               ('a@example.com', False), ('a@example.com', True),
+                                               ('b@example.com', False)]):
+            Verification.objects.create(email=email, token=f'{n:064x}', device_id='device',
+                                        verified=verified, expires_at=expires_at)
+        newest = Verification.objects.filter(email='a@example.com', verified=False).order_by('-id')[0].id
+
+        apps = self.migrate(self.after)
+        Verification = apps.get_model('feedback', 'EmailVerification')
+        self.assertEqual(list(Verification.objects.filter(email='a@example.com', verified=False)
+                              .values_list('id', flat=True)), [newest])
+        self.assertEqual(Verification.objects.filter(email='a@example.com', verified=True).count(), 1)
+        self.assertEqual(Verification.objects.filter(email='b@example.com').count(), 1)
+
+
+class IdempotencyKeyTest(VerifiedTokenTestCase):
+    """Retries with an Idempotency-Key, see feedback.idempotency."""
+
+    def payload(self, line='Line'):
+        return {'token': self.token, 'line': line, 'destination': 'Station', 'geo_location': '35.68,139.76'}
+
+    def submit(self, payload, key='key-1'):
+        return self.client.post('/api/submit-feedback/', payload, content_type='application/json',
+                                HTTP_IDEMPOTENCY_KEY=key, HTTP_X_DEVICE_ID='device')
+
+    def test_replays_successful_response(self):
+        first = self.submit(self.payload())
+        self.assertEqual(first.status_code, 200)
+        retry = self.submit(self.payload())
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(Feedback.objects.count(), 1)
+        # Another key runs the view again
+        self.assertEqual(self.submit(self.payload(), key='key-2').status_code, 200)
+        self.assertEqual(Feedback.objects.count(), 2)
+
+    def test_in_progress(self):
+        # The first request has claimed the key and is still running
+        request = RequestFactory().post('/api/submit-feedback/', self.payload(), content_type='application/json',
+                                        HTTP_IDEMPOTENCY_KEY='key-1', HTTP_X_DEVICE_ID='device')
+        record, _ = idempotency.begin(request)
+        self.assertIsNotNone(record)
+        retry = self.submit(self.payload())
+        self.assertEqual(retry.status_code, 409)
+        self.assertIn('Retry-After', retry)
+        self.assertFalse(Feedback.objects.exists())
+
+    def test_different_body(self):
+        self.assertEqual(self.submit(self.payload()).status_code, 200)
+        response = self.submit(self.payload(line='Other line'))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Feedback.objects.count(), 1)
+
+    def test_failed_request_can_be_retried(self):
+        payload = self.payload()
+        del payload['line']
+        self.assertEqual(self.submit(payload).status_code, 400)
+        # The key was released, so the corrected request runs
+        payload['line'] = 'Line'
+        self.assertEqual(self.submit(payload).status_code, 200)
+        self.assertEqual(Feedback.objects.count(), 1)
+
+
+class AccessTokenTest(VerifiedTokenTestCase):
+    """Signed access tokens and token checks of the submit endpoints, see feedback.access_tokens."""
+
+    def access_token(self):
+        response = self.client.get('/api/check-token/', {'token': self.token})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['access_token']
+
+    def submit(self, token):
+        return self.client.post('/api/submit-feedback/', {
+            'token': token, 'line': 'Line', 'destination': 'Station', 'geo_location': '35.68,139.76',
+        }, content_type='application/json', HTTP_X_DEVICE_ID='device')
+
+    def test_valid(self):
+        token = self.access_token()
+        self.assertEqual(self.submit(token).status_code, 200)
+        self.assertEqual(Feedback.objects.get().verification_id, self.verification.id)
+
+    def test_expired(self):
+        token = self.access_token()
+        later = time.time() + settings.ACCESS_TOKEN_LIFETIME + 60
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertEqual(self.submit(token).status_code, 403)
+            self.assertEqual(self.client.get('/api/check-token/', {'token': token}).status_code, 401)
+        self.assertFalse(Feedback.objects.exists())
+
+    def test_tampered(self):
+        token = self.access_token()
+        payload, timestamp, signature = token.split(':')
+        other = access_tokens.issue(EmailVerification(id=self.verification.id + 1, device_id='device'))[0]
+        for forged in (f'{payload}:{timestamp}:{signature[:-2]}xx', f'{other.split(":")[0]}:{timestamp}:{signature}'):
+            self.assertEqual(self.submit(forged).status_code, 403)
+            self.assertEqual(self.client.get('/api/check-token/', {'token': forged}).status_code, 404)
+        self.assertFalse(Feedback.objects.exists())
+
+    def test_revoked(self):
+        token = self.access_token()
+        call_command('revoke_access', 'user@example.com', stdout=io.StringIO())
+        self.assertEqual(self.submit(token).status_code, 403)
+        self.assertEqual(self.submit(self.token).status_code, 403)
+        self.assertEqual(self.client.get('/api/check-token/', {'token': token}).status_code, 403)
+        call_command('revoke_access', 'user@example.com', undo=True, stdout=io.StringIO())
+        self.assertEqual(self.submit(token).status_code, 200)
+
+    def test_non_string_token(self):
+        for token in (123, ['a' * 64], {'token': self.token}):
+            response = self.submit(token)
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(response.json()['detail'], 'Invalid token')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_ROUTERS=['feedback.replicas.ReplicaRouter'])
+class ReplicaRoutingTest(TransactionTestCase):
+    """Token lookups read from a replica, an SQLite alias of the test database here, see feedback.replicas."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Like TRATROUBLE_DATABASE_REPLICAS with SQLite: another connection to the
+        # same database. Added only now, since the test runner sets up the
+        # databases of the settings before any test class runs.
+        connections.settings['replica1'] = {**connections['default'].settings_dict}
+        cls.databases = cls.databases | {'replica1'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.token = 'a' * 64
+        self.verification = EmailVerification.objects.create(
+            email='user@example.com', token=self.token, device_id='device',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+    def lookup_queries(self, lookup):
+        """Number of queries of ``lookup()`` on the primary and on the replica."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica1']) as replica:
+            lookup()
+        return len(primary), len(replica)
+
+    def test_token_lookup_reads_from_replica(self):
+        self.assertEqual(self.lookup_queries(lambda: token_cache.get_verification(self.token)), (0, 1))
+        self.assertEqual(token_cache.get_verification(self.token), self.verification)  # As read from the replica
+        # Everything else stays on the primary
+        self.assertEqual(self.lookup_queries(lambda: EmailVerification.objects.get(token=self.token)), (1, 0))
+
+    def test_sticky_after_verify(self):
+        response = self.client.post('/api/verify-email/', {'token': self.token}, HTTP_X_DEVICE_ID='device')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(replicas.is_sticky(self.token))
+        token_cache.forget(self.token)  # As if the cached lookup had expired
+        primary, replica = self.lookup_queries(
+            lambda: self.assertEqual(self.client.get('/api/check-token/', {'token': self.token}).status_code, 200),
+        )
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        # Other tokens still read from the replica
+        self.assertEqual(self.lookup_queries(lambda: token_cache.get_verification('b' * 64)), (0, 1))
+
+
+class DeploymentChecksTest(TestCase):
+    """System checks of feedback.checks."""
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_replicas_need_shared_cache(self):
+        for backend in checks.PROCESS_LOCAL_CACHES:
+            with self.subTest(backend=backend), override_settings(CACHES={'default': {'BACKEND': backend}}):
+                self.assertEqual([error.id for error in checks.replicas_need_shared_cache(None)], ['feedback.E001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(checks.replicas_need_shared_cache(None), [])
+
+    def test_no_replicas(self):
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(checks.replicas_need_shared_cache(None), [])
+
+    def test_pool_available(self):
+        with override_settings(DATABASE_ENGINE='postgresql', DATABASE_POOL=True):
+            self.assertEqual([warning.id for warning in checks.pool_available(None)], ['feedback.W001'])
+        with override_settings(DATABASE_ENGINE='postgresql', DATABASE_POOL=False):
+            self.assertEqual(checks.pool_available(None), [])
+
+
+class FailingConnection:
+    """Email backend connection whose server is down."""
+
+    def open(self):
+        raise OSError('Connection refused')
+
+    def close(self):
+        pass
+
+
+@override_settings(EMAIL_OUTBOX_RETRY_SECONDS=30, EMAIL_OUTBOX_MAX_RETRY_SECONDS=3600, EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+                   EMAIL_OUTBOX_ABANDONED_RETENTION=86400)
+class OutboxTest(TestCase):
+    """Delivery of queued emails by send_outbox, see feedback.outbox."""
+
+    def test_send(self):
+        for n in range(3):
+            outbox.enqueue('Subject', 'Body', f'user{n}@example.com')
+        self.assertEqual(outbox.send_pending(), (3, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['user0@example.com', 'user1@example.com', 'user2@example.com'])
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_claim(self):
+        item = outbox.enqueue('Subject', 'Body', 'user@example.com')
+        # Two senders read the same due row; only the first claims it
+        first, second = OutboxEmail.objects.get(), OutboxEmail.objects.get()
+        self.assertTrue(outbox.claim(first))
+        self.assertFalse(outbox.claim(second))
+        item.refresh_from_db()
+        self.assertEqual(item.attempts, 1)
+        self.assertGreater(item.next_attempt_at, timezone.now())
+        # No longer due, so no other sender sends it meanwhile
+        self.assertEqual(outbox.send_pending(), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_backoff(self):
+        item = outbox.enqueue('Subject', 'Body', 'user@example.com')
+        self.assertEqual([outbox.retry_delay(attempts) for attempts in (1, 2, 3, 8, 20)], [30, 60, 120, 3600, 3600])
+        for attempts in (1, 2):
+            started = timezone.now()
+            self.assertEqual(outbox.send_pending(FailingConnection()), (0, 1))
+            item.refresh_from_db()
+            self.assertEqual(item.attempts, attempts)
+            self.assertEqual(item.last_error, 'OSError: Connection refused')
+            delay = (item.next_attempt_at - started).total_seconds()
+            self.assertTrue(outbox.retry_delay(attempts) <= delay < outbox.retry_delay(attempts) + 5)
+            # Not due before the delay is over
+            self.assertEqual(outbox.send_pending(FailingConnection()), (0, 0))
+            OutboxEmail.objects.filter(pk=item.pk).update(next_attempt_at=timezone.now())
+
+    def test_abandoned(self):
+        item = outbox.enqueue('Subject', 'Body', 'user@example.com')
+        OutboxEmail.objects.filter(pk=item.pk).update(attempts=2)
+        with self.assertLogs('feedback.outbox', 'ERROR'):
+            self.assertEqual(outbox.send_pending(FailingConnection()), (0, 1))
+        self.assertEqual(list(outbox.abandoned()), [item])
+        self.assertEqual(list(outbox.due_messages()), [])
+        self.assertEqual(outbox.send_pending(), (0, 0))
+        # Kept for the retention period, then deleted by sweep_expired
+        self.assertEqual(cleanup.sweep_abandoned_emails(), 0)
+        self.assertEqual(cleanup.sweep_abandoned_emails(now=timezone.now() + timedelta(days=2)), 1)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+class WriteBehindTest(TransactionTestCase):
+    """Feedback inserted by the flusher thread of the write-behind buffer, see feedback.write_behind."""
+
+    def setUp(self):
+        # Rows committed here are flushed after each test, their cached ids must go too
+        cache.clear()
+        interning.clear()
+        self.addCleanup(interning.clear)
+        self.verification = EmailVerification.objects.create(
+            email='user@example.com', token='a' * 64, device_id='device', verified=True,
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+    def rows(self, count):
+        return [ingestion.build_feedback(self.verification.id, {
+            'line': 'Line', 'destination': 'Station', 'geo_location': '35.68,139.76',
+        }) for _ in range(count)]
+
+    def test_flush_when_full(self):
+        buffer = write_behind.FeedbackBuffer(max_rows=3, max_delay=60)
+        self.addCleanup(buffer.close)
+        first, second = buffer.submit(self.rows(1)), buffer.submit(self.rows(2))
+        # One flush for both submissions
+        self.assertEqual(first.result(timeout=5), 3)
+        self.assertEqual(second.result(timeout=5), 3)
+        self.assertEqual(Feedback.objects.count(), 3)
+        self.assertEqual(buffer.stats()['flushes'], 1)
+
+    def test_flush_after_delay(self):
+        buffer = write_behind.FeedbackBuffer(max_rows=100, max_delay=0.01)
+        self.addCleanup(buffer.close)
+        self.assertEqual(buffer.submit(self.rows(1)).result(timeout=5), 1)
+        self.assertEqual(Feedback.objects.get().verification_id, self.verification.id)
+
+    def test_flush_on_close(self):
+        buffer = write_behind.FeedbackBuffer(max_rows=100, max_delay=60)
+        future = buffer.submit(self.rows(2))
+        buffer.close()
+        self.assertEqual(future.result(timeout=0), 2)
+        self.assertEqual(Feedback.objects.count(), 2)
+        with self.assertRaises(RuntimeError):
+            buffer.submit(self.rows(1))
+
+    @override_settings(FEEDBACK_WRITE_BEHIND=True, FEEDBACK_WRITE_BEHIND_WAIT=True)
+    def test_submit_feedback(self):
+        self.addCleanup(setattr, write_behind, '_buffer', None)
+        self.addCleanup(write_behind.shutdown)  # What atexit does
+        response = self.client.post('/api/submit-feedback/', {
+            'token': 'a' * 64, 'line': 'Line', 'destination': 'Station', 'geo_location': '35.68,139.76',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # Committed before the response
+        self.assertEqual(Feedback.objects.count(), 1)
+        self.assertEqual(write_behind.stats()['rows'], 1)
+
+
+class TopLinesTest(VerifiedTokenTestCase):
+    """Rankings of /api/top-lines/ from the hourly rollups, see feedback.rollups."""
+
+    def test_includes_current_hour(self):
+        for line in ('Old', 'New', 'New'):
+            ingestion.store_feedback([ingestion.build_feedback(self.verification.id, {
+                'line': line, 'destination': 'Station', 'geo_location': '35.68,139.76',
+            })])
+        FeedbackRollup.objects.filter(line='Old').update(
+            hour=rollups.hour_bucket(timezone.now()) - timedelta(hours=3),
+        )
+        response = self.client.get('/api/top-lines/', {'token': self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['line'], row['count']) for row in response.json()['lines']], [('New', 2), ('Old', 1)])
+        # An explicit until excludes its partial hour
+        until = rollups.hour_bucket(timezone.now()).isoformat()
+        response = self.client.get('/api/top-lines/', {'token': self.token, 'until': until})
+        self.assertEqual([(row['line'], row['count']) for row in response.json()['lines']], [('Old', 1)])
+
+
+class MetricsEndpointTest(TestCase):
+    """/api/metrics/ when METRICS_DIR cannot be used, see feedback.metrics.collect()."""
+
+    def test_unwritable_metrics_dir(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # A file where the directory should be
+            metrics_dir = os.path.join(directory, 'metrics')
+            open(metrics_dir, 'w').close()
+            metrics.inc('tratrouble_requests_total', view='test-view', status=200)
+            with override_settings(METRICS_DIR=metrics_dir, METRICS_TOKEN='scraper'), \
+                    self.assertLogs('feedback.metrics', 'WARNING'):
+                response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('tratrouble_requests_total{status="200",view="test-view"}', response.content.decode())
+
+
+class AdmissionRateLimitTest(TestCase):
+    """Token buckets of feedback.admission under concurrent requests."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_burst_not_exceeded(self):
+        requests = 8
+        statuses = []
+        started = threading.Barrier(requests)
+        real_get = LocMemCache.get
+
+        def slow_get(self, *args, **kwargs):
+            # Widens the window between reading and writing back the bucket
+            value = real_get(self, *args, **kwargs)
+            time.sleep(0.01)
+            return value
+
+        def send():
+            started.wait()
+            request = RequestFactory().get('/api/check-token/', HTTP_X_DEVICE_ID='device')
+            statuses.append(middleware(request).status_code)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(ADMISSION_LOCK_DIR=directory,
+                                  ADMISSION_LIMITS={'check-token': {'rate': 0.01, 'burst': 3}}), \
+                mock.patch.object(LocMemCache, 'get', slow_get):
+            middleware = admission.AdmissionControlMiddleware(lambda request: HttpResponse())
+            threads = [threading.Thread(target=send) for _ in range(requests)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(statuses), [200] * 3 + [429] * 5)
@@ -0,0 +1,105 @@
+"""Cache of EmailVerification lookups by token.
+
+IsValidTokenPermission and CheckTokenView only need to know whether a token
+exists and is verified, so we keep the EmailVerification row in Django's cache
+instead of reading it from the database on every call. Unknown tokens are
+cached as well, and VerifyEmailView writes the verified row through to the
+cache so that the next request never has to hit the database. The lookups
+that do reach the database read from a replica if there is one, see
+feedback.replicas.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import replicas
+from .models import EmailVerification
+
+KEY_PREFIX = 'feedback:token:'
+
+# Stored in place of a row for tokens that do not exist
+_UNKNOWN = 'unknown'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _key(token):
+    return f"{KEY_PREFIX}{token}"
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _timeout(ev):
+    if ev is None or not ev.verified:
+        return settings.TOKEN_CACHE_NEGATIVE_TIMEOUT
+    remaining = int((ev.expires_at - timezone.now()).total_seconds())
+    if remaining > 0:
+        return max(1, min(settings.TOKEN_CACHE_TIMEOUT, remaining))
+    # Past expires_at the row can no longer change, so use the full timeout
+    return settings.TOKEN_CACHE_TIMEOUT
+
+
+def _lookup(token):
+    with replicas.replica_reads(not replicas.is_sticky(token)):
+        return EmailVerification.objects.filter(token=token).first()
+
+
+async def _alookup(token):
+    with replicas.replica_reads(not await replicas.ais_sticky(token)):
+        return await EmailVerification.objects.filter(token=token).afirst()
+
+
+def get_verification(token):
+    """Return the EmailVerification for ``token``, or None if there is none."""
+    if not settings.TOKEN_CACHE_ENABLED:
+        return _lookup(token)
+
+    cached = cache.get(_key(token))
+    if cached is not None:
+        _count('hits')
+        return None if cached == _UNKNOWN else cached
+
+    _count('misses')
+    ev = _lookup(token)
+    cache.set(_key(token), _UNKNOWN if ev is None else ev, _timeout(ev))
+    return ev
+
+
+async def aget_verification(token):
+    """Async version of get_verification() for the ASGI views."""
+    if not settings.TOKEN_CACHE_ENABLED:
+        return await _alookup(token)
+
+    cached = await cache.aget(_key(token))
+    if cached is not None:
+        _count('hits')
+        return None if cached == _UNKNOWN else cached
+
+    _count('misses')
+    ev = await _alookup(token)
+    await cache.aset(_key(token), _UNKNOWN if ev is None else ev, _timeout(ev))
+    return ev
+
+
+def remember(ev):
+    """Write ``ev`` through to the cache, e.g. right after it was verified."""
+    if settings.TOKEN_CACHE_ENABLED:
+        cache.set(_key(ev.token), ev, _timeout(ev))
+
+
+def forget(*tokens):
+    """Drop cached entries, e.g. after the rows were deleted."""
+    if settings.TOKEN_CACHE_ENABLED and tokens:
+        cache.delete_many([_key(token) for token in tokens])
+
+
+def stats():
+    """Hit/miss counters of this process."""
+    with _stats_lock:
+        return dict(_stats)
@@ -1,11 +1,24 @@
+from django.conf import settings
 from django.urls import path
 from .views import SubmitEmailView, VerifyEmailView, SubmitFeedbackView, CheckTokenView
 from .views import SubmitEmailView, VerifyEmailView, SubmitFeedbackView, CheckTokenView, BadJsonView
+from .views import SubmitFeedbackBatchView, TopLinesView, ExportFeedbackView, FeedbackListView, MetricsView, ProfilingView
+
+if settings.FEEDBACK_ASYNC_VIEWS:
+    # Serving under ASGI, see tratroubleBackend/asgi.py
+    from .async_views import AsyncSubmitFeedbackView as SubmitFeedbackView
+    from .async_views import AsyncCheckTokenView as CheckTokenView
 
 urlpatterns = [
     path('submit-email/', SubmitEmailView.as_view(), name='submit-email'),
     path('verify-email/', VerifyEmailView.as_view(), name='verify-email'),
     path('submit-feedback/', SubmitFeedbackView.as_view(), name='submit-feedback'),
+    path('submit-feedback-batch/', SubmitFeedbackBatchView.as_view(), name='submit-feedback-batch'),
     path('bad-json/', BadJsonView.as_view(), name='bad-json'),
     path('check-token/', CheckTokenView.as_view(), name='check-token'),
+    path('top-lines/', TopLinesView.as_view(), name='top-lines'),
+    path('feedback/', FeedbackListView.as_view(), name='feedback-list'),
+    path('export-feedback/', ExportFeedbackView.as_view(), name='export-feedback'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('profiling/', ProfilingView.as_view(), name='profiling'),
 ]
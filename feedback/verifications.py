@@ -0,0 +1,77 @@
+"""Issuing email verifications without a new row and email per submission.
+
+Each email address and device has at most one pending (unverified)
+verification, enforced by the ``one_pending_verification`` constraint. A
+repeated submit-email reuses it and sends the same link again, at most once
+per EMAIL_VERIFICATION_RESEND_INTERVAL. It only gets a new token once it has
+expired or is older than EMAIL_VERIFICATION_REUSE_WINDOW.
+
+Concurrent submissions from several workers are settled by the database.
+The unique constraint lets only one of them create the row. Renewing and
+resending are conditional UPDATEs, so only one of them sends the email.
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import token_cache
+from .models import EmailVerification
+
+
+class ResendThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Verification email was sent less than {settings.EMAIL_VERIFICATION_RESEND_INTERVAL}s ago')
+        self.retry_after = retry_after  # Seconds
+
+
+def issue(email, device_id, platform, new_token, lifetime):
+    """The verification to send an email for, recorded as sent now.
+
+    Reuses the pending verification of ``email`` and ``device_id`` if there is
+    one; ``new_token()`` makes the token of a new or renewed verification,
+    which is valid for ``lifetime`` (a timedelta). Raises ResendThrottled if
+    the email should not be sent again yet.
+    """
+    now = timezone.now()
+    interval = timedelta(seconds=settings.EMAIL_VERIFICATION_RESEND_INTERVAL)
+    pending = EmailVerification.objects.filter(email=email, device_id=device_id, verified=False)
+    for _ in range(3):  # Start over when a concurrent request changed the row first
+        ev = pending.first()
+        if ev is None:
+            try:
+                with transaction.atomic():
+                    return EmailVerification.objects.create(
+                        email=email, token=new_token(), device_id=device_id, platform=platform,
+                        expires_at=now + lifetime, last_sent_at=now,
+                    )
+            except IntegrityError:
+                continue
+
+        reusable = ev.expires_at > now and ev.created_at > now - timedelta(seconds=settings.EMAIL_VERIFICATION_REUSE_WINDOW)
+        if not reusable:
+            old_token = ev.token
+            changes = {
+                'token': new_token(), 'platform': platform,
+                'created_at': now, 'expires_at': now + lifetime, 'last_sent_at': now,
+            }
+            if pending.filter(pk=ev.pk, token=old_token).update(**changes):
+                for name, value in changes.items():
+                    setattr(ev, name, value)
+                transaction.on_commit(lambda: token_cache.forget(old_token))
+                return ev
+            continue
+
+        if ev.last_sent_at is not None and ev.last_sent_at + interval > now:
+            raise ResendThrottled(math.ceil((ev.last_sent_at + interval - now).total_seconds()))
+        if pending.filter(pk=ev.pk, last_sent_at=ev.last_sent_at).update(last_sent_at=now):
+            ev.last_sent_at = now
+            return ev
+    raise ResendThrottled(settings.EMAIL_VERIFICATION_RESEND_INTERVAL)
+
+
+def unsent(ev):
+    """Undo the ``last_sent_at`` of issue() after the email could not be sent, so the user may retry at once."""
+    EmailVerification.objects.filter(pk=ev.pk, last_sent_at=ev.last_sent_at).update(last_sent_at=None)
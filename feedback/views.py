@@ -1,14 +1,20 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import BasePermission
+from rest_framework.permissions import BasePermission, IsAdminUser
 from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
 from django.core.mail import send_mail
 from django.conf import settings
-from django.utils.crypto import salted_hmac
-from .models import Feedback, EmailVerification
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from .models import EmailVerification
+from . import access_tokens, captures, export, ingestion, listing, metrics, outbox, profiling, replicas, rollups
+from . import token_cache, verifications
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import hashlib
 import hmac
 import secrets
@@ -23,18 +29,39 @@ class IsValidTokenPermission(BasePermission):
             token = request.data.get('token')
         if not token:
             raise AuthenticationFailed('Token is required')
-        try:
-            ev = EmailVerification.objects.get(token=token)
-        except EmailVerification.DoesNotExist:
+        if access_tokens.is_access_token(token):
+            try:
+                claims = access_tokens.verify(token, request.META.get('HTTP_X_DEVICE_ID'))
+            except access_tokens.InvalidAccessToken as exc:
+                raise AuthenticationFailed(str(exc))
+            request.verification_id = claims.verification_id
+            return True
+        if not isinstance(token, str):
+            # E.g. a number in the JSON body
+            raise AuthenticationFailed('Invalid token')
+        ev = token_cache.get_verification(token)
+        if ev is None:
             raise AuthenticationFailed('Invalid token')
         if not ev.verified:
             raise PermissionDenied('Email not verified for this token')
+        if access_tokens.is_revoked(ev.id):
+            raise PermissionDenied('Access revoked')
         request.email_verification = ev
+        request.verification_id = ev.id
         return True
 
+class IsMetricsScraper(BasePermission):
+    """Staff users, or requests with ``Authorization: Bearer <METRICS_TOKEN>``."""
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        provided = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(settings.METRICS_TOKEN) and hmac.compare_digest(provided, expected)
+
 # Import email verification domain
 from tratroubleBackend.email_config import EMAIL_VERIFICATION_DOMAIN
-from tratroubleBackend.email_config import EMAIL_VERIFICATION_APP_NAME
 
 class DeviceIdentifier:
     def get_device_id(self, request):
@@ -52,6 +79,17 @@ class DeviceIdentifier:
 
         return device_id
 
+def parse_time_param(value, default=None):
+    """Parse an ISO 8601 query parameter; naive values are taken as UTC."""
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
 class SubmitEmailView(APIView):
     TOKEN_EXPIRY_HOURS = 24
 
@@ -61,32 +99,42 @@ class SubmitEmailView(APIView):
             return Response({'error': 'Email is required'}, status=status.HTTP_400_BAD_REQUEST)
         platform = request.data.get('platform') or 'web'
         device_id = DeviceIdentifier().get_device_id(request)
-        token_data = f"{email}{device_id}{secrets.token_urlsafe(16)}{timezone.now().timestamp()}"
-        secret_key = settings.SECRET_KEY.encode('utf-8')
 
-        # Generate token using HMAC with secret key
-        token = self._generate_hmac_token(email, device_id)
-        expires_at = timezone.now() + timedelta(hours=self.TOKEN_EXPIRY_HOURS)
-        
-        # Create or update EmailVerification record
-        ev = EmailVerification.objects.create(
-            email=email,
-            token=token,
-            device_id=device_id,
-            platform=platform,
-            created_at=timezone.now(),
-            expires_at=expires_at,
-            verified=False,
-        )
+        subject = 'Verify your email'
 
-        verification_link = f"https://{EMAIL_VERIFICATION_DOMAIN}/api/verify-email/?token={token}"
-        send_mail(
-            'Verify your email',
-            f'Click the link to verify your email: {verification_link}',
-            settings.DEFAULT_FROM_EMAIL,
-            [email],
-            fail_silently=False,
-        )
+        with transaction.atomic():
+            # Reuses the pending verification of this email and device, if any
+            try:
+                ev = verifications.issue(
+                    email, device_id, platform,
+                    new_token=lambda: self._generate_hmac_token(email, device_id),
+                    lifetime=timedelta(hours=self.TOKEN_EXPIRY_HOURS),
+                )
+            except verifications.ResendThrottled as exc:
+                return Response(
+                    {'error': 'Verification email was sent recently', 'retry_after': exc.retry_after},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={'Retry-After': str(exc.retry_after)},
+                )
+            verification_link = f"https://{EMAIL_VERIFICATION_DOMAIN}/api/verify-email/?token={ev.token}"
+            body = f'Click the link to verify your email: {verification_link}'
+            if settings.EMAIL_OUTBOX_ENABLED:
+                # Delivered by the send_outbox command once this commits
+                outbox.enqueue(subject, body, email)
+
+        if not settings.EMAIL_OUTBOX_ENABLED:
+            try:
+                with metrics.timed('tratrouble_email_send_seconds', via='inline'):
+                    send_mail(
+                        subject,
+                        body,
+                        settings.DEFAULT_FROM_EMAIL,
+                        [email],
+                        fail_silently=False,
+                    )
+            except Exception:
+                verifications.unsent(ev)
+                raise
         return Response({'message': 'Verification email sent'})
 
     def _generate_hmac_token(self, email, device_id):
@@ -136,8 +184,10 @@ class VerifyEmailView(APIView):
 
         ev.verified = True
         ev.save()
+        token_cache.remember(ev)
+        replicas.stick(token)
 
-        return Response({'message': 'Email verified successfully'})
+        return Response({'message': 'Email verified successfully', **access_tokens.grant(ev)})
 
 class SubmitFeedbackView(APIView):
     permission_classes = [IsValidTokenPermission]
@@ -151,14 +201,48 @@ class SubmitFeedbackView(APIView):
         if not all([token, line, destination, geo_location]):
             return Response({'error': 'All fields are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        feedback = Feedback.objects.create(
-            token=token,
-            line=line,
-            destination=destination,
-            geo_location=geo_location
-        )
+        error = ingestion.validate_item(request.data)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        ingestion.submit_feedback([ingestion.build_feedback(request.verification_id, request.data)])
         return Response({'message': 'Feedback submitted successfully'})
-        
+
+class SubmitFeedbackBatchView(APIView):
+    """Submit several feedback items under one token, e.g. trips buffered while offline.
+
+    Expects ``{"token": ..., "items": [{"line", "destination", "geo_location"}, ...]}``.
+    Invalid items are reported per index; all valid ones are inserted together.
+    """
+    permission_classes = [IsValidTokenPermission]
+
+    def post(self, request):
+        items = request.data.get('items')
+
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'items must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.FEEDBACK_BATCH_MAX_SIZE:
+            return Response({
+                'error': 'Too many items',
+                'max_items': settings.FEEDBACK_BATCH_MAX_SIZE,
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        rows = []
+        results = []
+        for index, item in enumerate(items):
+            error = ingestion.validate_item(item)
+            if error:
+                results.append({'index': index, 'status': 'rejected', 'error': error})
+            else:
+                rows.append(ingestion.build_feedback(request.verification_id, item))
+                results.append({'index': index, 'status': 'created'})
+
+        ingestion.submit_feedback(rows)
+        return Response({
+            'message': f'{len(rows)} of {len(items)} feedback items submitted',
+            'results': results,
+        })
+
 class BadJsonView(APIView):
     permission_classes = [IsValidTokenPermission]
 
@@ -170,7 +254,11 @@ class BadJsonView(APIView):
         if not all([token, json_str, target]):
             return Response({'error': 'All fields are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        print(f"Received bad-json request with token={token}, json={json_str}, target={target}")
+        captures.capture(
+            token, target, json_str,
+            verification_id=request.verification_id,
+            device_id=request.META.get('HTTP_X_DEVICE_ID', ''),
+        )
         return Response({'message': 'Received bad-json request'})
 
 class CheckTokenView(APIView):
@@ -179,12 +267,159 @@ class CheckTokenView(APIView):
         if not token:
             return Response({'error': 'Token is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            ev = EmailVerification.objects.get(token=token)
-        except EmailVerification.DoesNotExist:
+        if access_tokens.is_access_token(token):
+            try:
+                access_tokens.verify(token, request.META.get('HTTP_X_DEVICE_ID'))
+            except access_tokens.InvalidAccessToken as exc:
+                return Response({'error': str(exc)}, status=exc.status_code)
+            return Response({'message': 'ok'}, status=status.HTTP_200_OK)
+
+        ev = token_cache.get_verification(token)
+        if ev is None:
             return Response({'error': 'Unknown token'}, status=status.HTTP_404_NOT_FOUND)
 
         if not ev.verified:
             return Response({'error': 'Email not verified for this token'}, status=status.HTTP_403_FORBIDDEN)
 
-        return Response({'message': 'ok'}, status=status.HTTP_200_OK)
+        if access_tokens.is_revoked(ev.id):
+            return Response({'error': 'Access revoked'}, status=status.HTTP_403_FORBIDDEN)
+
+        # Lets apps verified before access tokens existed switch to them
+        return Response({'message': 'ok', **access_tokens.grant(ev)}, status=status.HTTP_200_OK)
+
+class TopLinesView(APIView):
+    """Lines with the most feedback in a time range, served from the rollups.
+
+    Query parameters: ``since`` and ``until`` (ISO 8601) and ``limit``. The range
+    is rounded down to whole hours. By default it covers the 24 hours up to the
+    end of the current hour, so that the newest feedback counts as well.
+    """
+    permission_classes = [IsValidTokenPermission]
+    DEFAULT_RANGE_HOURS = 24
+    DEFAULT_LIMIT = 10
+    MAX_LIMIT = 100
+
+    def get(self, request):
+        next_hour = rollups.hour_bucket(timezone.now()) + timedelta(hours=1)
+        try:
+            until = parse_time_param(request.query_params.get('until'), next_hour)
+            since = parse_time_param(request.query_params.get('since'), until - timedelta(hours=self.DEFAULT_RANGE_HOURS))
+            limit = int(request.query_params.get('limit', self.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'error': 'Invalid since, until or limit'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        return Response({
+            'since': since,
+            'until': until,
+            'lines': rollups.top_lines(since, until, limit),
+        })
+
+class ExportFeedbackView(APIView):
+    """Staff-only streaming export of all feedback.
+
+    Query parameters: ``fmt`` (``ndjson`` or ``csv``), ``since_id`` and/or ``since``
+    for incremental exports, and ``gzip=1`` to compress the download.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        fmt = request.query_params.get('fmt', 'ndjson')
+        if fmt not in export.FORMATS:
+            return Response({'error': f'fmt must be one of {", ".join(export.FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since_id = int(request.query_params.get('since_id', 0))
+            since = parse_time_param(request.query_params.get('since'))
+        except ValueError:
+            return Response({'error': 'Invalid since_id or since'}, status=status.HTTP_400_BAD_REQUEST)
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+
+        filename = f'feedback.{fmt}' + ('.gz' if gzip else '')
+        response = StreamingHttpResponse(
+            export.stream(export.iter_rows(since_id, since), fmt, gzip),
+            content_type='application/gzip' if gzip else export.CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class FeedbackListView(APIView):
+    """Staff-only listing of feedback, newest first, one page at a time.
+
+    Query parameters: ``line``, ``destination``, ``since`` and ``until`` (ISO
+    8601) to filter, ``limit``, and ``cursor``, the ``next_cursor`` of the
+    previous page. Responses carry an ETag and Last-Modified, and a conditional
+    request for an unchanged page is answered with 304.
+    """
+    permission_classes = [IsAdminUser]
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+
+    def get(self, request):
+        params = {name: request.query_params.get(name)
+                  for name in ('line', 'destination', 'since', 'until', 'cursor')}
+        try:
+            since = parse_time_param(params['since'])
+            until = parse_time_param(params['until'])
+            cursor = listing.decode_cursor(params['cursor']) if params['cursor'] else None
+            limit = int(request.query_params.get('limit', self.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'error': 'Invalid since, until, cursor or limit'}, status=status.HTTP_400_BAD_REQUEST)
+        params['limit'] = limit = max(1, min(limit, self.MAX_LIMIT))
+
+        qs = listing.filtered(params['line'], params['destination'], since, until)
+        newest = listing.newest(qs)
+        etag = quote_etag(listing.etag(newest, params))
+        last_modified = int(newest[0].timestamp()) if newest else None
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        results, next_cursor = listing.page(qs, cursor, limit)
+        response = Response({'results': results, 'next_cursor': next_cursor})
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # May be stored, but must be revalidated every time
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+class ProfilingView(APIView):
+    """Staff-only switch for profiling a sample of all requests, see feedback.profiling.
+
+    POST ``{"sample_rate": 0.05, "minutes": 10}`` profiles 5% of the requests
+    of the next 10 minutes; ``"sample_rate": 0`` switches sampling off.
+    """
+    permission_classes = [IsAdminUser]
+    DEFAULT_MINUTES = 10
+    MAX_MINUTES = 24 * 60
+
+    def get(self, request):
+        return Response(self._state(profiling.sampling()))
+
+    def post(self, request):
+        try:
+            sample_rate = float(request.data.get('sample_rate'))
+            minutes = float(request.data.get('minutes', self.DEFAULT_MINUTES))
+        except (TypeError, ValueError):
+            return Response({'error': 'sample_rate and minutes must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= sample_rate <= 1 or not 0 < minutes <= self.MAX_MINUTES:
+            return Response({'error': f'sample_rate must be between 0 and 1, minutes between 0 and {self.MAX_MINUTES}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(self._state(profiling.switch_sampling(sample_rate, minutes * 60)))
+
+    @staticmethod
+    def _state(state):
+        until = state['until'] if state['sample_rate'] else None
+        return {
+            'enabled': settings.PROFILING_ENABLED,
+            'sample_rate': state['sample_rate'],
+            'until': datetime.fromtimestamp(until, dt_timezone.utc) if until else None,
+        }
+
+class MetricsView(APIView):
+    """Metrics of all worker processes in the Prometheus text format."""
+    permission_classes = [IsMetricsScraper]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
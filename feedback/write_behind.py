@@ -0,0 +1,151 @@
+"""Write-behind buffer for feedback inserts (group commit).
+
+With FEEDBACK_WRITE_BEHIND enabled, views hand validated rows to a buffer of
+the current process. A background thread inserts everything buffered with
+one bulk insert and one commit, as soon as FEEDBACK_WRITE_BEHIND_MAX_ROWS rows
+are waiting or the oldest row has waited FEEDBACK_WRITE_BEHIND_MAX_DELAY_MS.
+The buffer is flushed when the process exits.
+
+Rows get their timestamp when they are flushed, i.e. at most the maximum
+delay after they were submitted.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import ingestion
+
+logger = logging.getLogger(__name__)
+
+
+class FeedbackBuffer:
+    def __init__(self, max_rows, max_delay):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        self._pending = []  # (rows, future) per submission
+        self._pending_rows = 0
+        self._oldest = None
+        self._closed = False
+        self._stats = {
+            'flushes': 0,
+            'failed_flushes': 0,
+            'rows': 0,
+            'flush_seconds': 0.0,
+            'max_flush_rows': 0,
+            'max_flush_seconds': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name='feedback-write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        """Queue unsaved Feedback ``rows``; the future completes once they are committed."""
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Feedback buffer is closed')
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((rows, future))
+            self._pending_rows += len(rows)
+            if self._pending_rows >= self.max_rows:
+                self._condition.notify()
+            elif len(self._pending) == 1:
+                # Wake the flusher to start the delay timer
+                self._condition.notify()
+        return future
+
+    def close(self):
+        """Flush what is buffered and stop the flusher thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, buffered_rows=self._pending_rows)
+
+    def _take_batch(self):
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            deadline = (self._oldest or time.monotonic()) + self.max_delay
+            while self._pending_rows < self.max_rows and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending
+            self._pending = []
+            self._pending_rows = 0
+            self._oldest = None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+            elif self._closed:
+                return
+
+    def _flush(self, batch):
+        rows = [row for submitted, _ in batch for row in submitted]
+        started = time.monotonic()
+        try:
+            close_old_connections()
+            ingestion.store_feedback(rows)
+        except Exception as exc:
+            logger.exception("Flushing %s buffered feedback rows failed", len(rows))
+            with self._condition:
+                self._stats['failed_flushes'] += 1
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        elapsed = time.monotonic() - started
+        with self._condition:
+            self._stats['flushes'] += 1
+            self._stats['rows'] += len(rows)
+            self._stats['flush_seconds'] += elapsed
+            self._stats['max_flush_rows'] = max(self._stats['max_flush_rows'], len(rows))
+            self._stats['max_flush_seconds'] = max(self._stats['max_flush_seconds'], elapsed)
+        for _, future in batch:
+            future.set_result(len(rows))
+
+
+_buffer = None
+_buffer_pid = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """The buffer of the current process, created on first use (also after a fork)."""
+    global _buffer, _buffer_pid
+    with _buffer_lock:
+        if _buffer is None or _buffer_pid != os.getpid():
+            _buffer = FeedbackBuffer(
+                settings.FEEDBACK_WRITE_BEHIND_MAX_ROWS,
+                settings.FEEDBACK_WRITE_BEHIND_MAX_DELAY_MS / 1000,
+            )
+            _buffer_pid = os.getpid()
+        return _buffer
+
+
+def stats():
+    """Counters of this process's buffer, or None if it was never used."""
+    if _buffer is None or _buffer_pid != os.getpid():
+        return None
+    return _buffer.stats()
+
+
+@atexit.register
+def shutdown():
+    if _buffer is not None and _buffer_pid == os.getpid():
+        _buffer.close()
@@ -0,0 +1,11 @@
+# Signed access token configuration (feedback/access_tokens.py)
+import os
+
+# Issue signed access tokens on verify-email and check-token
+ACCESS_TOKENS_ENABLED = os.getenv('TRATROUBLE_ACCESS_TOKENS_ENABLED', 'True').lower() == 'true'
+# Validity of an access token; apps get a fresh one from check-token
+ACCESS_TOKEN_LIFETIME = int(os.getenv('TRATROUBLE_ACCESS_TOKEN_LIFETIME', str(30 * 24 * 3600)))
+# Reject access tokens sent with an X-Device-ID other than the verifying device's
+ACCESS_TOKEN_BIND_DEVICE = os.getenv('TRATROUBLE_ACCESS_TOKEN_BIND_DEVICE', 'False').lower() == 'true'
+# Seconds between reloads of the revocation list in every process
+ACCESS_TOKEN_REVOCATION_REFRESH = float(os.getenv('TRATROUBLE_ACCESS_TOKEN_REVOCATION_REFRESH', '30'))
@@ -0,0 +1,31 @@
+# Admission control configuration (feedback/admission.py)
+import json
+import os
+import tempfile
+
+ADMISSION_CONTROL_ENABLED = os.getenv('TRATROUBLE_ADMISSION_CONTROL', 'False').lower() == 'true'
+
+# Directory for the lock files that implement the concurrency limits and guard
+# the rate limit buckets; all workers that should share the limits must use
+# the same directory.
+ADMISSION_LOCK_DIR = os.getenv(
+    'TRATROUBLE_ADMISSION_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'tratrouble-admission'),
+)
+
+# Per URL name:
+#   concurrency - requests handled at the same time, across all workers
+#   queue_ms    - how long a request may wait for a free slot before it is shed with 503
+#   rate, burst - token bucket per device id: sustained requests per second and burst size (429)
+ADMISSION_LIMITS = {
+    'submit-email': {'concurrency': 4, 'queue_ms': 100, 'rate': 0.2, 'burst': 3},
+    'verify-email': {'concurrency': 8, 'queue_ms': 200, 'rate': 1, 'burst': 5},
+    'submit-feedback': {'concurrency': 16, 'queue_ms': 250, 'rate': 2, 'burst': 20},
+    'bad-json': {'concurrency': 2, 'queue_ms': 50, 'rate': 0.5, 'burst': 5},
+    'check-token': {'concurrency': 32, 'queue_ms': 500, 'rate': 5, 'burst': 20},
+}
+
+# JSON object merged into the defaults, e.g. '{"submit-email": {"concurrency": 2}}'
+_overrides = os.getenv('TRATROUBLE_ADMISSION_LIMITS')
+if _overrides:
+    for _name, _limits in json.loads(_overrides).items():
+        ADMISSION_LIMITS.setdefault(_name, {}).update(_limits)
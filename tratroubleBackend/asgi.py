@@ -2,6 +2,7 @@
 ASGI config for tratroubleBackend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with e.g. ``uvicorn tratroubleBackend.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +13,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tratroubleBackend.settings')
+# Serve the hot endpoints with the async views (feedback/async_views.py)
+os.environ.setdefault('TRATROUBLE_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
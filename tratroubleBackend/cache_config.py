@@ -0,0 +1,15 @@
+# Cache configuration
+import os
+
+# Django cache backend. The default in-process cache is private to each gunicorn
+# worker; point this at a shared backend (e.g. FileBasedCache on the data volume,
+# Memcached or Redis) so that every worker sees the same token states.
+CACHE_BACKEND = os.getenv('TRATROUBLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHE_LOCATION = os.getenv('TRATROUBLE_CACHE_LOCATION', 'tratrouble')
+
+# Token status cache used by IsValidTokenPermission and CheckTokenView
+TOKEN_CACHE_ENABLED = os.getenv('TRATROUBLE_TOKEN_CACHE_ENABLED', 'True').lower() == 'true'
+# Upper bound (seconds) for how long a verified token is cached
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TRATROUBLE_TOKEN_CACHE_TIMEOUT', '3600'))
+# How long (seconds) unknown and not-yet-verified tokens are cached
+TOKEN_CACHE_NEGATIVE_TIMEOUT = int(os.getenv('TRATROUBLE_TOKEN_CACHE_NEGATIVE_TIMEOUT', '5'))
@@ -0,0 +1,19 @@
+# Capture store for payloads posted to bad-json (feedback/captures.py)
+import os
+
+# Directory of the compressed NDJSON segments (default: logs/bad-json)
+BAD_JSON_DIR = os.getenv('TRATROUBLE_BAD_JSON_DIR', '')
+
+# A process starts a new segment once it has written this many uncompressed bytes to the current one
+BAD_JSON_SEGMENT_BYTES = int(os.getenv('TRATROUBLE_BAD_JSON_SEGMENT_BYTES', str(16 * 1024 * 1024)))
+
+# Payloads are written and fsynced in batches, at most this many seconds after they arrived
+BAD_JSON_FLUSH_INTERVAL = float(os.getenv('TRATROUBLE_BAD_JSON_FLUSH_INTERVAL', '1'))
+
+# Payloads waiting to be written per process; further payloads are dropped
+BAD_JSON_QUEUE_SIZE = int(os.getenv('TRATROUBLE_BAD_JSON_QUEUE_SIZE', '10000'))
+
+# The oldest segments are deleted once all segments together take more than
+# this many bytes, or once they were last written to this many days ago
+BAD_JSON_RETENTION_BYTES = int(os.getenv('TRATROUBLE_BAD_JSON_RETENTION_BYTES', str(512 * 1024 * 1024)))
+BAD_JSON_RETENTION_DAYS = float(os.getenv('TRATROUBLE_BAD_JSON_RETENTION_DAYS', '30'))
@@ -0,0 +1,57 @@
+# Database configuration
+import os
+
+# 'sqlite' or 'postgresql'. Running more than one container needs PostgreSQL.
+DATABASE_ENGINE = os.getenv('TRATROUBLE_DATABASE_ENGINE', 'sqlite')
+
+# PostgreSQL primary, which receives all writes
+DATABASE_NAME = os.getenv('TRATROUBLE_DATABASE_NAME', 'tratrouble')
+DATABASE_USER = os.getenv('TRATROUBLE_DATABASE_USER', 'tratrouble')
+DATABASE_PASSWORD = os.getenv('TRATROUBLE_DATABASE_PASSWORD', '')
+DATABASE_HOST = os.getenv('TRATROUBLE_DATABASE_HOST', 'localhost')
+DATABASE_PORT = os.getenv('TRATROUBLE_DATABASE_PORT', '5432')
+DATABASE_SSLMODE = os.getenv('TRATROUBLE_DATABASE_SSLMODE', '')
+
+# Comma-separated read replicas that serve the token lookups: host[:port] or
+# [IPv6 address][:port] of PostgreSQL standbys with the same database, user
+# and password as the primary, or SQLite database files
+DATABASE_REPLICA_HOSTS = [host.strip() for host in os.getenv('TRATROUBLE_DATABASE_REPLICAS', '').split(',') if host.strip()]
+
+# Seconds the token lookups of a freshly verified token keep reading from the
+# primary, until the replicas have caught up with the verification
+DATABASE_STICKY_SECONDS = int(os.getenv('TRATROUBLE_DATABASE_STICKY_SECONDS', '10'))
+
+# PostgreSQL connection pool per process. Only with psycopg 3 and psycopg_pool
+# installed; with psycopg2, connections are kept open for CONN_MAX_AGE instead.
+DATABASE_POOL = os.getenv('TRATROUBLE_DATABASE_POOL', 'True').lower() == 'true'
+DATABASE_POOL_MIN_SIZE = int(os.getenv('TRATROUBLE_DATABASE_POOL_MIN_SIZE', '2'))
+DATABASE_POOL_MAX_SIZE = int(os.getenv('TRATROUBLE_DATABASE_POOL_MAX_SIZE', '10'))
+# Seconds a request waits for a free pooled connection
+DATABASE_POOL_TIMEOUT = float(os.getenv('TRATROUBLE_DATABASE_POOL_TIMEOUT', '10'))
+
+# SQLite database file (default: data/db.sqlite3 in the project directory)
+SQLITE_PATH = os.getenv('TRATROUBLE_SQLITE_PATH', '')
+
+# 'default' keeps SQLite's defaults. 'production' switches to WAL with a busy
+# timeout and persistent connections, for several concurrent gunicorn workers.
+DATABASE_PROFILE = os.getenv('TRATROUBLE_DATABASE_PROFILE', 'default')
+
+# Seconds a connection waits for a competing writer before "database is locked"
+SQLITE_BUSY_TIMEOUT = float(os.getenv('TRATROUBLE_SQLITE_BUSY_TIMEOUT', '20'))
+SQLITE_MMAP_SIZE = int(os.getenv('TRATROUBLE_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('TRATROUBLE_SQLITE_CACHE_SIZE_KB', str(64 * 1024)))
+
+# Seconds a database connection is kept open across requests (SQLite production profile, PostgreSQL without pool)
+CONN_MAX_AGE = int(os.getenv('TRATROUBLE_CONN_MAX_AGE', '600'))
+
+
+def split_host_port(value, default_port):
+    """``(host, port)`` of a replica given as ``host``, ``host:port``, ``[address]`` or ``[address]:port``."""
+    if value.startswith('['):
+        host, _, rest = value[1:].partition(']')
+        return host, rest[1:] if rest.startswith(':') and rest[1:] else default_port
+    if value.count(':') == 1:
+        host, _, port = value.partition(':')
+        return host, port or default_port
+    # A host name, or an IPv6 address without brackets
+    return value, default_port
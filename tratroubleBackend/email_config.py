@@ -3,3 +3,24 @@ import os
 
 EMAIL_VERIFICATION_DOMAIN = os.getenv('TRATROUBLE_EMAIL_VERIFICATION_DOMAIN', 'your.domain.tld')
 EMAIL_VERIFICATION_APP_NAME = os.getenv('TRATROUBLE_EMAIL_VERIFICATION_APP_NAME', 'com.mydomain.myappname')
+
+# A repeated submit-email for the same email address and device reuses the
+# pending verification (and sends the same link again) if it was created less
+# than this many seconds ago and has not expired; otherwise it gets a new token
+EMAIL_VERIFICATION_REUSE_WINDOW = int(os.getenv('TRATROUBLE_EMAIL_VERIFICATION_REUSE_WINDOW', '3600'))
+# Minimum seconds between two emails for the same pending verification; earlier
+# resends are answered with 429
+EMAIL_VERIFICATION_RESEND_INTERVAL = int(os.getenv('TRATROUBLE_EMAIL_VERIFICATION_RESEND_INTERVAL', '60'))
+
+# Outbox: when enabled, SubmitEmailView only stores outgoing mail in the database
+# and the `send_outbox` management command delivers it in the background.
+EMAIL_OUTBOX_ENABLED = os.getenv('TRATROUBLE_EMAIL_OUTBOX', 'False').lower() == 'true'
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('TRATROUBLE_EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv('TRATROUBLE_EMAIL_OUTBOX_POLL_SECONDS', '1'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('TRATROUBLE_EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+# Retry delay doubles with every failed attempt, starting at this many seconds
+EMAIL_OUTBOX_RETRY_SECONDS = int(os.getenv('TRATROUBLE_EMAIL_OUTBOX_RETRY_SECONDS', '30'))
+EMAIL_OUTBOX_MAX_RETRY_SECONDS = int(os.getenv('TRATROUBLE_EMAIL_OUTBOX_MAX_RETRY_SECONDS', '3600'))
+# Seconds an email that used up its attempts stays in the outbox, for
+# inspection, before the sweep_expired command deletes it
+EMAIL_OUTBOX_ABANDONED_RETENTION = int(os.getenv('TRATROUBLE_EMAIL_OUTBOX_ABANDONED_RETENTION', '604800'))
@@ -0,0 +1,36 @@
+# Feedback ingestion configuration
+import os
+
+# Maximum number of items accepted by a single submit-feedback-batch request
+FEEDBACK_BATCH_MAX_SIZE = int(os.getenv('TRATROUBLE_FEEDBACK_BATCH_MAX_SIZE', '100'))
+
+# Write-behind ingestion: submitted feedback is collected in a per-process
+# buffer and inserted with one bulk insert per flush instead of one
+# transaction per request.
+FEEDBACK_WRITE_BEHIND = os.getenv('TRATROUBLE_FEEDBACK_WRITE_BEHIND', 'False').lower() == 'true'
+# Flush once this many rows are buffered...
+FEEDBACK_WRITE_BEHIND_MAX_ROWS = int(os.getenv('TRATROUBLE_FEEDBACK_WRITE_BEHIND_MAX_ROWS', '50'))
+# ...or the oldest buffered row has waited this many milliseconds
+FEEDBACK_WRITE_BEHIND_MAX_DELAY_MS = int(os.getenv('TRATROUBLE_FEEDBACK_WRITE_BEHIND_MAX_DELAY_MS', '50'))
+# Whether requests wait until their rows are committed. If not, rows still in
+# the buffer are lost when the process dies without a clean shutdown.
+FEEDBACK_WRITE_BEHIND_WAIT = os.getenv('TRATROUBLE_FEEDBACK_WRITE_BEHIND_WAIT', 'True').lower() == 'true'
+
+# Serve check-token and submit-feedback with the async views of
+# feedback/async_views.py. tratroubleBackend/asgi.py turns this on.
+FEEDBACK_ASYNC_VIEWS = os.getenv('TRATROUBLE_ASYNC_VIEWS', 'False').lower() == 'true'
+
+# The staff feedback listing leaves out rows newer than this many seconds:
+# their transactions may still be running alongside others that will commit
+# rows with earlier timestamps, which a client paging by timestamp would miss.
+# Keep it above the longest feedback insert transaction.
+FEEDBACK_LIST_SETTLE_SECONDS = float(os.getenv('TRATROUBLE_FEEDBACK_LIST_SETTLE_SECONDS', '5'))
+
+# Idempotency-Key header on POST requests: the first successful response to a
+# key is stored and replayed to retries of the same request for this many
+# seconds, instead of running the view again.
+IDEMPOTENCY_KEYS_ENABLED = os.getenv('TRATROUBLE_IDEMPOTENCY_KEYS', 'True').lower() == 'true'
+IDEMPOTENCY_KEY_TTL = int(os.getenv('TRATROUBLE_IDEMPOTENCY_KEY_TTL', '86400'))
+# A request with a key that is still running after this many seconds is
+# assumed to have died with its worker, and the next retry runs the view again
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('TRATROUBLE_IDEMPOTENCY_LOCK_TIMEOUT', '60'))
@@ -0,0 +1,33 @@
+"""gunicorn settings used by ``python manage.py serve``
+(``gunicorn -c python:tratroubleBackend.gunicorn_conf``).
+
+The app is imported once in the master (preload_app) and warmed up there
+before any worker is forked, so new workers serve their first request at
+full speed and share the imported code copy-on-write. Set the number of
+workers with WEB_CONCURRENCY.
+"""
+import os
+
+bind = os.getenv('TRATROUBLE_BIND', '0.0.0.0:8000')
+accesslog = '-'
+errorlog = '-'
+preload_app = True
+
+
+def when_ready(server):
+    # In the master, after the app was loaded and the socket bound, before the workers start
+    from tratroubleBackend import startup
+
+    timings = startup.warm_up()
+    steps = ', '.join(f'{step} {seconds * 1000:.0f} ms' for step, seconds in timings.items())
+    elapsed = startup.seconds_since_start()
+    if elapsed is None:
+        server.log.info("Warmed up (%s)", steps)
+    else:
+        server.log.info("Ready %.2f s after start (warm-up: %s)", elapsed, steps)
+
+
+def post_worker_init(worker):
+    from tratroubleBackend import startup
+
+    startup.connect()
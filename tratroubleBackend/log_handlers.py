@@ -0,0 +1,182 @@
+"""Logging building blocks used by settings.LOGGING.
+
+QueueingHandler is the only handler attached to the loggers: on the request
+thread it merely puts the record into a bounded queue, and a listener thread
+passes it on to the handlers that do the actual I/O (console, rotating file).
+"""
+import atexit
+import copy
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueListener, RotatingFileHandler
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotate without the cross-process lock
+    fcntl = None
+
+
+def _handler_by_name(name):
+    getter = getattr(logging, 'getHandlerByName', None)  # Python 3.12+
+    return getter(name) if getter else logging._handlers.get(name)
+
+
+class QueueingHandler(logging.Handler):
+    """Hands records to a listener thread that runs the ``targets`` handlers.
+
+    ``targets`` are names of other handlers in the logging configuration. The
+    listener is started on first use in every process, so the handler keeps
+    working in workers forked after logging was configured. Records are
+    dropped (and counted in ``dropped``) rather than blocking the caller when
+    the queue is full.
+    """
+
+    def __init__(self, targets=(), queue_size=10000, level=logging.NOTSET):
+        super().__init__(level)
+        # logging only keeps weak references to handlers no logger uses, so hold on to them
+        self.targets = [_handler_by_name(name) for name in targets]
+        if None in self.targets:
+            # dictConfig() retries handlers that fail with this message once the others exist
+            raise ValueError('target not configured yet')
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._pid = None
+        self._queue = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self._queue = queue.Queue(self.queue_size)
+            self._listener = QueueListener(self._queue, *self.targets, respect_handler_level=True)
+            self._listener.start()
+            atexit.register(self._stop_listener)
+            self._pid = pid
+
+    def prepare(self, record):
+        # Like QueueHandler.prepare(): merge the arguments and render the
+        # traceback now, while they are guaranteed to still be valid.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def _stop_listener(self):
+        # Writes out what is still queued. Forked workers inherit the atexit
+        # registration, so only stop a listener started by this process.
+        with self._start_lock:
+            if self._pid == os.getpid():
+                self._listener.stop()
+                self._pid = None
+
+    def close(self):
+        self._stop_listener()
+        super().close()
+
+    def emit(self, record):
+        try:
+            self._ensure_listener()
+            self._queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+def _gzip_namer(name):
+    return name + '.gz'
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+class GzipRotatingFileHandler(RotatingFileHandler):
+    """Size-based rotation with gzip-compressed backups, safe for several processes.
+
+    Rotation is done under an exclusive lock on ``<filename>.lock``, and every
+    process reopens the file once another process has rotated it away.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namer = _gzip_namer
+        self.rotator = _gzip_rotator
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            current = None
+        opened = os.fstat(self.stream.fileno())
+        if current is None or (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+            self.stream.close()
+            self.stream = self._open()
+
+    def emit(self, record):
+        try:
+            self._reopen_if_rotated()
+            if self.shouldRollover(record):
+                with open(self.baseFilename + '.lock', 'a') as lock:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_EX)
+                    self._reopen_if_rotated()
+                    if self.shouldRollover(record):
+                        self.doRollover()
+            logging.FileHandler.emit(self, record)
+        except Exception:
+            self.handleError(record)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through only a random ``rate`` fraction of the records."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.process,
+            'thread': record.thread,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        # Extras Django adds to SQL and request log records
+        for key in ('duration', 'sql', 'alias', 'status_code'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        return json.dumps(entry, default=str)
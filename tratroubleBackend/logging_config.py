@@ -0,0 +1,12 @@
+# Logging configuration
+import os
+
+# logs/debug.log is rotated at this size and keeps this many gzipped backups
+LOG_FILE_MAX_BYTES = int(os.getenv('TRATROUBLE_LOG_FILE_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(os.getenv('TRATROUBLE_LOG_FILE_BACKUP_COUNT', '10'))
+
+# Records waiting for the logging thread; further records are dropped
+LOG_QUEUE_SIZE = int(os.getenv('TRATROUBLE_LOG_QUEUE_SIZE', '10000'))
+
+# Fraction of SQL statements logged by django.db.backends (only logged with DEBUG)
+LOG_SQL_SAMPLE_RATE = float(os.getenv('TRATROUBLE_LOG_SQL_SAMPLE_RATE', '0.1'))
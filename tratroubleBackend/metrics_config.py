@@ -0,0 +1,17 @@
+# Metrics configuration (feedback/metrics.py)
+import os
+import tempfile
+
+# Record request latency, status codes, SQL queries and email send times
+METRICS_ENABLED = os.getenv('TRATROUBLE_METRICS', 'True').lower() == 'true'
+
+# Every process writes its counters to a file in this directory, and the
+# metrics endpoint adds up all files. Processes that should be reported
+# together (gunicorn workers, the send_outbox command) must share it.
+METRICS_DIR = os.getenv('TRATROUBLE_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'tratrouble-metrics'))
+
+# Minimum seconds between two writes of a process's metrics file
+METRICS_WRITE_INTERVAL = float(os.getenv('TRATROUBLE_METRICS_WRITE_INTERVAL', '5'))
+
+# Bearer token for scraping /api/metrics/; staff users can always read it
+METRICS_TOKEN = os.getenv('TRATROUBLE_METRICS_TOKEN', '')
@@ -0,0 +1,22 @@
+# On-demand request profiling (feedback/profiling.py)
+import os
+
+# Install the profiling middleware. It only profiles requests with a signed
+# X-Tratrouble-Profile header, and a sample of requests while a staff user
+# has switched sampling on via /api/profiling/.
+PROFILING_ENABLED = os.getenv('TRATROUBLE_PROFILING', 'False').lower() == 'true'
+
+# Directory of the captured profiles (default: logs/profiles)
+PROFILING_DIR = os.getenv('TRATROUBLE_PROFILING_DIR', '')
+
+# The oldest profiles are deleted once there are more than this many
+PROFILING_MAX_PROFILES = int(os.getenv('TRATROUBLE_PROFILING_MAX_PROFILES', '200'))
+
+# Seconds a signed profiling header stays valid
+PROFILING_HEADER_MAX_AGE = int(os.getenv('TRATROUBLE_PROFILING_HEADER_MAX_AGE', '3600'))
+
+# SQL statements recorded per profiled request; further statements are only counted
+PROFILING_MAX_QUERIES = int(os.getenv('TRATROUBLE_PROFILING_MAX_QUERIES', '1000'))
+
+# Seconds a process keeps using the sampling switch before reading it from the cache again
+PROFILING_SWITCH_CHECK_INTERVAL = float(os.getenv('TRATROUBLE_PROFILING_SWITCH_CHECK_INTERVAL', '5'))
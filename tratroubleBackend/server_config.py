@@ -19,3 +19,9 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 # Allow X-Forwarded-For header for client IP detection
 USE_X_FORWARDED_HOST = True
+
+# Requests under these path prefixes that carry no session cookie skip the
+# session, CSRF, auth, messages and X-Frame-Options middleware, which only the
+# admin and staff logins need (see feedback/middleware.py)
+LEAN_API_MIDDLEWARE = os.getenv('TRATROUBLE_LEAN_API_MIDDLEWARE', 'True').lower() == 'true'
+LEAN_API_PATHS = os.getenv('TRATROUBLE_LEAN_API_PATHS', '/api/').split(',')
@@ -29,6 +29,7 @@ LOGS_DIR.mkdir(exist_ok=True)
 
 # Import server configuration
 from .server_config import ALLOWED_HOSTS, DEBUG, SECRET_KEY, CORS_ALLOWED_ORIGINS
+from .server_config import LEAN_API_MIDDLEWARE, LEAN_API_PATHS
 
 
 # Application definition
@@ -59,6 +60,47 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Only needed by the admin and browser sessions of staff users
+SESSION_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+if LEAN_API_MIDDLEWARE:
+    # LeanAPIMiddleware runs SESSION_MIDDLEWARE itself, except for API requests without a session
+    MIDDLEWARE = [name for name in MIDDLEWARE if name not in SESSION_MIDDLEWARE]
+    MIDDLEWARE.insert(MIDDLEWARE.index('corsheaders.middleware.CorsMiddleware') + 1,
+                      'feedback.middleware.LeanAPIMiddleware')
+    # The admin checks look for these in MIDDLEWARE, but LeanAPIMiddleware runs them for /admin/
+    SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
+from .admission_config import ADMISSION_CONTROL_ENABLED, ADMISSION_LOCK_DIR, ADMISSION_LIMITS
+
+if ADMISSION_CONTROL_ENABLED:
+    # After CorsMiddleware so that shed responses still carry CORS headers
+    MIDDLEWARE.insert(MIDDLEWARE.index('corsheaders.middleware.CorsMiddleware') + 1,
+                      'feedback.admission.AdmissionControlMiddleware')
+
+from .metrics_config import METRICS_ENABLED, METRICS_DIR, METRICS_WRITE_INTERVAL, METRICS_TOKEN
+
+if METRICS_ENABLED:
+    # First, so that the timings include the other middleware
+    MIDDLEWARE.insert(0, 'feedback.metrics.MetricsMiddleware')
+
+from .profiling_config import (
+    PROFILING_ENABLED, PROFILING_DIR, PROFILING_MAX_PROFILES, PROFILING_HEADER_MAX_AGE,
+    PROFILING_MAX_QUERIES, PROFILING_SWITCH_CHECK_INTERVAL,
+)
+
+PROFILING_DIR = PROFILING_DIR or str(LOGS_DIR / 'profiles')
+
+if PROFILING_ENABLED:
+    # Outermost, so that profiles include all other middleware
+    MIDDLEWARE.insert(0, 'feedback.profiling.ProfilingMiddleware')
+
 ROOT_URLCONF = 'tratroubleBackend.urls'
 
 TEMPLATES = [
@@ -82,12 +124,75 @@ WSGI_APPLICATION = 'tratroubleBackend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'data' / 'db.sqlite3',
+from .database_config import (
+    SQLITE_PATH, DATABASE_PROFILE, SQLITE_BUSY_TIMEOUT, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB,
+    CONN_MAX_AGE, DATABASE_ENGINE, DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST,
+    DATABASE_PORT, DATABASE_SSLMODE, DATABASE_REPLICA_HOSTS, DATABASE_STICKY_SECONDS, DATABASE_POOL,
+    DATABASE_POOL_MIN_SIZE, DATABASE_POOL_MAX_SIZE, DATABASE_POOL_TIMEOUT, split_host_port,
+)
+
+from copy import deepcopy
+from importlib.util import find_spec
+
+if DATABASE_ENGINE == 'postgresql':
+    primary = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': DATABASE_NAME,
+        'USER': DATABASE_USER,
+        'PASSWORD': DATABASE_PASSWORD,
+        'OPTIONS': {'sslmode': DATABASE_SSLMODE} if DATABASE_SSLMODE else {},
+    }
+    if DATABASE_POOL and find_spec('psycopg') and find_spec('psycopg_pool'):
+        # Pooled connections are returned to the pool after every request,
+        # which rules out CONN_MAX_AGE
+        primary['OPTIONS']['pool'] = {
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+            'timeout': DATABASE_POOL_TIMEOUT,
+        }
+    else:
+        primary.update({'CONN_MAX_AGE': CONN_MAX_AGE, 'CONN_HEALTH_CHECKS': True})
+    DATABASES = {'default': {**deepcopy(primary), 'HOST': DATABASE_HOST, 'PORT': DATABASE_PORT}}
+    replicas = []
+    for host in DATABASE_REPLICA_HOSTS:
+        host, port = split_host_port(host, DATABASE_PORT)
+        replicas.append({**deepcopy(primary), 'HOST': host, 'PORT': port})
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH or BASE_DIR / 'data' / 'db.sqlite3',
+        }
     }
-}
+
+    if DATABASE_PROFILE == 'production':
+        # WAL lets readers proceed while a writer commits, and synchronous=NORMAL
+        # only fsyncs at checkpoints. Transactions take the write lock up front
+        # (IMMEDIATE) so that waiting for it honours the busy timeout instead of
+        # failing with "database is locked" when a read lock is upgraded.
+        DATABASES['default'].update({
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+                    f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB};'
+                ),
+            },
+        })
+    replicas = [{**deepcopy(DATABASES['default']), 'NAME': path} for path in DATABASE_REPLICA_HOSTS]
+
+# Read replicas, used through feedback.replicas.ReplicaRouter. Tests run them
+# against the test database of the primary.
+for number, replica in enumerate(replicas, 1):
+    DATABASES[f'replica{number}'] = {**replica, 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['feedback.replicas.ReplicaRouter']
 
 
 # Password validation
@@ -133,13 +238,62 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 from .email_credentials import *
+from .email_config import (
+    EMAIL_VERIFICATION_REUSE_WINDOW, EMAIL_VERIFICATION_RESEND_INTERVAL,
+    EMAIL_OUTBOX_ENABLED, EMAIL_OUTBOX_BATCH_SIZE, EMAIL_OUTBOX_POLL_SECONDS,
+    EMAIL_OUTBOX_MAX_ATTEMPTS, EMAIL_OUTBOX_RETRY_SECONDS, EMAIL_OUTBOX_MAX_RETRY_SECONDS,
+    EMAIL_OUTBOX_ABANDONED_RETENTION,
+)
+from .cache_config import (
+    CACHE_BACKEND, CACHE_LOCATION,
+    TOKEN_CACHE_ENABLED, TOKEN_CACHE_TIMEOUT, TOKEN_CACHE_NEGATIVE_TIMEOUT,
+)
+from .feedback_config import (
+    FEEDBACK_BATCH_MAX_SIZE,
+    FEEDBACK_WRITE_BEHIND, FEEDBACK_WRITE_BEHIND_MAX_ROWS, FEEDBACK_WRITE_BEHIND_MAX_DELAY_MS,
+    FEEDBACK_WRITE_BEHIND_WAIT,
+    FEEDBACK_ASYNC_VIEWS,
+    FEEDBACK_LIST_SETTLE_SECONDS,
+    IDEMPOTENCY_KEYS_ENABLED, IDEMPOTENCY_KEY_TTL, IDEMPOTENCY_LOCK_TIMEOUT,
+)
+
+if IDEMPOTENCY_KEYS_ENABLED:
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.common.CommonMiddleware'),
+                      'feedback.idempotency.IdempotencyMiddleware')
+
+# Import signed access token configuration
+from .access_token_config import (
+    ACCESS_TOKENS_ENABLED, ACCESS_TOKEN_LIFETIME, ACCESS_TOKEN_BIND_DEVICE, ACCESS_TOKEN_REVOCATION_REFRESH,
+)
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    }
+}
+
 # CORS configuration
 CORS_ALLOWED_ORIGINS = CORS_ALLOWED_ORIGINS
 
+# Capture store of the bad-json endpoint
+from .capture_config import (
+    BAD_JSON_DIR, BAD_JSON_SEGMENT_BYTES, BAD_JSON_FLUSH_INTERVAL, BAD_JSON_QUEUE_SIZE,
+    BAD_JSON_RETENTION_BYTES, BAD_JSON_RETENTION_DAYS,
+)
+
+BAD_JSON_DIR = BAD_JSON_DIR or str(LOGS_DIR / 'bad-json')
+
 # Logging configuration for debugging
+from .logging_config import LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT, LOG_QUEUE_SIZE, LOG_SQL_SAMPLE_RATE
+
+# Loggers only enqueue records on the 'queue' handler; a background thread
+# writes them to the console and the rotating JSON log file.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -152,6 +306,15 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'tratroubleBackend.log_handlers.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sql_sample': {
+            '()': 'tratroubleBackend.log_handlers.SamplingFilter',
+            'rate': LOG_SQL_SAMPLE_RATE,
+        },
     },
     'handlers': {
         'console': {
@@ -159,23 +322,32 @@ LOGGING = {
             'formatter': 'verbose',
         },
         'file': {
-            'class': 'logging.FileHandler',
+            'class': 'tratroubleBackend.log_handlers.GzipRotatingFileHandler',
             'filename': str(LOGS_DIR / 'debug.log'),
-            'formatter': 'verbose',
+            'maxBytes': LOG_FILE_MAX_BYTES,
+            'backupCount': LOG_FILE_BACKUP_COUNT,
+            'delay': True,
+            'formatter': 'json',
+        },
+        'queue': {
+            'class': 'tratroubleBackend.log_handlers.QueueingHandler',
+            'targets': ['console', 'file'],
+            'queue_size': LOG_QUEUE_SIZE,
         },
     },
     'root': {
-        'handlers': ['console', 'file'],
+        'handlers': ['queue'],
         'level': 'DEBUG' if DEBUG else 'INFO',
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
         'django.db.backends': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
+            'filters': ['sql_sample'],
             'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
@@ -0,0 +1,123 @@
+"""Container start: only do the work that is needed, then warm the app up.
+
+Used by the ``serve`` management command and tratroubleBackend/gunicorn_conf.py:
+
+* ``collect_static()`` runs collectstatic only if the static source files
+  changed since the last run, judged by a fingerprint of their paths, sizes
+  and modification times stored in STATIC_ROOT. The Dockerfile runs it while
+  building the image, so containers find the stamp and skip it.
+* ``migrate()`` runs migrate only if there are unapplied migrations.
+* ``warm_up()`` runs in the gunicorn master after the app was preloaded and
+  does what would otherwise slow down the first requests of every worker.
+* ``connect()`` opens the database connections of a fresh worker.
+"""
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.urls import get_resolver
+
+FINGERPRINT_FILE = '.collectstatic-fingerprint'
+# collectstatic's default ignore patterns
+IGNORE_PATTERNS = ['CVS', '.*', '*~']
+# Resolved during warm-up so that the URL patterns and views are imported
+WARM_UP_PATH = '/api/check-token/'
+# Set by the serve command for the startup time reported by gunicorn
+STARTED_ENV = 'TRATROUBLE_STARTUP_STARTED'
+
+
+@contextmanager
+def timed(timings, step):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = time.perf_counter() - started
+
+
+def static_fingerprint():
+    """Hash of the paths, sizes and mtimes of all files collectstatic would copy."""
+    entries = []
+    for finder in finders.get_finders():
+        for path, storage in finder.list(IGNORE_PATTERNS):
+            stat = os.stat(storage.path(path))
+            entries.append(f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}')
+    digest = hashlib.sha256(str(settings.STATIC_ROOT).encode())
+    for entry in sorted(entries):
+        digest.update(entry.encode() + b'\n')
+    return digest.hexdigest()
+
+
+def collect_static(verbosity=1):
+    """Run collectstatic unless the sources are unchanged. Returns whether it ran."""
+    fingerprint = static_fingerprint()
+    stamp = os.path.join(settings.STATIC_ROOT, FINGERPRINT_FILE)
+    try:
+        with open(stamp) as f:
+            if f.read().strip() == fingerprint:
+                return False
+    except FileNotFoundError:
+        pass
+    call_command('collectstatic', interactive=False, verbosity=verbosity)
+    os.makedirs(settings.STATIC_ROOT, exist_ok=True)
+    with open(stamp, 'w') as f:
+        f.write(fingerprint + '\n')
+    return True
+
+
+def pending_migrations(database=DEFAULT_DB_ALIAS):
+    executor = MigrationExecutor(connections[database])
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def migrate(verbosity=1, database=DEFAULT_DB_ALIAS):
+    """Run migrate if any migration is unapplied. Returns whether it ran."""
+    if not pending_migrations(database):
+        return False
+    call_command('migrate', interactive=False, verbosity=verbosity, database=database)
+    return True
+
+
+def warm_up():
+    """Import and initialize what the first requests would. Returns the seconds per step."""
+    timings = {}
+    with timed(timings, 'urls'):
+        # Populates the resolver, which imports all URL modules and views
+        get_resolver().resolve(WARM_UP_PATH)
+    with timed(timings, 'api'):
+        from rest_framework.settings import api_settings
+        for name in ('DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES',
+                     'DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES'):
+            getattr(api_settings, name)
+    with timed(timings, 'database'):
+        # Checks that the database is reachable. The connections are closed
+        # again, forked workers must not share them.
+        for alias in connections:
+            connections[alias].ensure_connection()
+        connections.close_all()
+        for alias in connections:
+            # A PostgreSQL connection pool must not be inherited either
+            if hasattr(connections[alias], 'close_pool'):
+                connections[alias].close_pool()
+    with timed(timings, 'cache'):
+        caches['default'].get('startup-warm-up')
+    return timings
+
+
+def connect():
+    """Open the database connections of the current process ahead of its first request."""
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def seconds_since_start():
+    """Seconds since the serve command started, or None if it was not used."""
+    started = os.environ.get(STARTED_ENV)
+    return time.time() - float(started) if started else None